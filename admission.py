@@ -0,0 +1,108 @@
+import os
+import math
+
+import metrics
+from ratelimit import KeyedLimiter
+
+# ── Admission control ────────────────────────────────────────────────────────
+# Checked by /send-message before anything is written, so an abusive client is
+# turned away with a cheap 429 instead of queueing work that slows down
+# everyone else. Three limits apply:
+#   - a token bucket per client (API key if sent, otherwise IP address);
+#     off by default
+#   - a token bucket per session
+#   - a cap on a session's messages that are queued or being answered
+# Limits set to 0 are off. A message is only counted against the buckets
+# when it is admitted.
+#
+# All three are kept per process: with N instances behind a load balancer a
+# client or session can get up to N times the limit, and the pending cap only
+# counts the session's messages queued or running on this instance.
+#
+# Behind a reverse proxy or load balancer every request arrives from the
+# proxy's address, so without TRUST_PROXY=1 all users would share one client
+# bucket. Only set ADMISSION_CLIENT_RATE once client IPs are real (or callers
+# send X-API-Key).
+
+ADMISSION_CLIENT_RATE = float(os.getenv("ADMISSION_CLIENT_RATE", "0"))     # messages/s
+ADMISSION_CLIENT_BURST = float(os.getenv("ADMISSION_CLIENT_BURST", "20"))
+ADMISSION_SESSION_RATE = float(os.getenv("ADMISSION_SESSION_RATE", "0.5"))
+ADMISSION_SESSION_BURST = float(os.getenv("ADMISSION_SESSION_BURST", "5"))
+ADMISSION_SESSION_PENDING = int(os.getenv("ADMISSION_SESSION_PENDING", "3"))
+# Use the first X-Forwarded-For hop as the client IP (only behind a proxy you trust)
+TRUST_PROXY = os.getenv("TRUST_PROXY", "0") == "1"
+
+
+def parse_client_weights(spec: str) -> dict[str, float]:
+    weights = {}
+    for item in spec.split(","):
+        if "=" in item:
+            client, weight = item.rsplit("=", 1)
+            # FairQueue divides by the weight
+            if float(weight) <= 0:
+                raise ValueError(f"CLIENT_WEIGHTS: weight for {client.strip()!r} must be > 0, got {weight.strip()}")
+            weights[client.strip()] = float(weight)
+    return weights
+
+
+# Fair-queuing weights for particular clients, e.g. "key:partner-a=4,10.0.0.5=2"
+CLIENT_WEIGHTS = parse_client_weights(os.getenv("CLIENT_WEIGHTS", ""))
+
+rejected = metrics.registry.counter(
+    "admission_rejected_total", "Messages refused by admission control.", ("reason",)
+)
+
+
+def client_key(request) -> str:
+    """Identify the caller: its API key when it sends one, otherwise its IP."""
+    api_key = request.headers.get("x-api-key")
+    if api_key:
+        return f"key:{api_key}"
+    if TRUST_PROXY and (forwarded := request.headers.get("x-forwarded-for")):
+        return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def client_weight(client: str) -> float:
+    return CLIENT_WEIGHTS.get(client, 1)
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdmissionControl:
+    def __init__(
+        self,
+        client_rate: float = ADMISSION_CLIENT_RATE,
+        client_burst: float = ADMISSION_CLIENT_BURST,
+        session_rate: float = ADMISSION_SESSION_RATE,
+        session_burst: float = ADMISSION_SESSION_BURST,
+        session_pending: int = ADMISSION_SESSION_PENDING,
+    ):
+        self.clients = KeyedLimiter(client_rate, client_burst) if client_rate > 0 else None
+        self.sessions = KeyedLimiter(session_rate, session_burst) if session_rate > 0 else None
+        self.session_pending = session_pending
+
+    def check(self, client: str, session_id: str, session_load: int = 0):
+        """Raise Rejected (with a Retry-After) if this message should be refused."""
+        if self.session_pending and session_load >= self.session_pending:
+            self._reject("session_busy", 2)
+        # Look at both buckets before taking from either, so a refused message
+        # doesn't use up the other one's allowance
+        client_bucket = self.clients.bucket(client) if self.clients else None
+        session_bucket = self.sessions.bucket(str(session_id)) if self.sessions else None
+        if client_bucket and (wait := client_bucket.wait_time()) > 0:
+            self._reject("client_rate", wait)
+        if session_bucket and (wait := session_bucket.wait_time()) > 0:
+            self._reject("session_rate", wait)
+        for bucket in (client_bucket, session_bucket):
+            if bucket:
+                bucket.try_acquire()
+
+    def _reject(self, reason: str, retry_after: float):
+        rejected.inc(reason=reason)
+        raise Rejected(reason, retry_after)
@@ -0,0 +1,78 @@
+"""
+Requests/sec for the old per-call `requests.post` path versus the pooled
+async client in openrouter_client.py, both against the local stub server.
+
+    python benchmarks/bench_client.py --requests 500 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_openrouter import StubConfig, start_stub
+
+MESSAGES = [{"role": "user", "content": "ping"}]
+
+
+def bench_requests(base_url: str, total: int, concurrency: int) -> float:
+    import requests
+
+    def call(_):
+        requests.post(
+            url=f"{base_url}/chat/completions",
+            headers={"Content-Type": "application/json"},
+            json={"model": "stub/model", "messages": MESSAGES},
+        ).json()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, range(total)))
+    return total / (time.perf_counter() - start)
+
+
+async def bench_pooled(total: int, concurrency: int) -> float:
+    import openrouter_client
+
+    sem = asyncio.Semaphore(concurrency)
+
+    async def call():
+        async with sem:
+            await openrouter_client.chat_completion({"model": "stub/model", "messages": MESSAGES})
+
+    start = time.perf_counter()
+    await asyncio.gather(*(call() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+    await openrouter_client.close_client()
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0, help="stub model latency in seconds")
+    args = parser.parse_args()
+
+    StubConfig.latency = args.latency
+    server = start_stub()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/api/v1"
+    os.environ["OPENROUTER_BASE_URL"] = base_url
+    # Compare the clients, not the client-side rate limiters
+    os.environ["OPENROUTER_KEY_RATE"] = "0"
+    os.environ["OPENROUTER_MODEL_RATE"] = "0"
+
+    before = bench_requests(base_url, args.requests, args.concurrency)
+    after = asyncio.run(bench_pooled(args.requests, args.concurrency))
+
+    print(f"requests.post per call : {before:8.1f} req/s")
+    print(f"pooled async client    : {after:8.1f} req/s")
+    print(f"speedup                : {after / before:8.2f}x")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
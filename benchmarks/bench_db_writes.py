@@ -0,0 +1,69 @@
+"""
+Round-trips and wall time per chat turn for the old one-call-per-write path
+versus the batched RPCs (record_user_message + complete_turn), against the
+fake PostgREST server with an emulated network latency.
+
+    python benchmarks/bench_db_writes.py --turns 50 --latency 0.02
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from fake_postgrest import FakeConfig, start_fake_postgrest, store
+
+
+async def old_turn(db, session_id):
+    existing = await db.get_session(session_id)
+    if not existing:
+        await db.create_session(session_id, "New Chat", "stub/model")
+    else:
+        await db.update_session_model(session_id, "stub/model")
+    msg_id = (await db.send_message_to_db(session_id, "User", "hello", "Pending")).data[0]["id"]
+    await db.update_message_state(msg_id, "Completed")
+    await db.send_message_to_db(session_id, "assistant", "hi there", "Completed")
+
+
+async def batched_turn(db, session_id):
+    msg_id = (await db.record_user_message(session_id, "stub/model", "hello")).data[0]["id"]
+    await db.complete_turn(msg_id, session_id, "hi there")
+
+
+async def measure(db, turn, turns):
+    before = store.requests
+    start = time.perf_counter()
+    for _ in range(turns):
+        await turn(db, uuid.uuid4())
+    elapsed = time.perf_counter() - start
+    return (store.requests - before) / turns, elapsed / turns * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.02, help="emulated round-trip in seconds")
+    args = parser.parse_args()
+
+    FakeConfig.latency = args.latency
+    server = start_fake_postgrest()
+    os.environ["SUPABASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["SUPABASE_KEY"] = "fake.fake.fake"
+    import db_async
+
+    async def run():
+        for name, turn in (("separate writes", old_turn), ("batched RPCs", batched_turn)):
+            calls, ms = await measure(db_async, turn, args.turns)
+            print(f"{name:16}: {calls:4.1f} round-trips/turn, {ms:7.1f} ms/turn")
+        await db_async.close_client()
+
+    asyncio.run(run())
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Import-time budget for the app: imports worker.py in a fresh interpreter
+with `python -X importtime`, with the Supabase and OpenRouter settings removed
+from the environment and .env loading switched off (LOAD_DOTENV=0), and
+reports the total, the slowest modules and anything printed while
+importing. Exits 1 when the import takes longer than --budget seconds (the
+best of --runs) or when it writes to stdout, so it can gate CI.
+
+    python benchmarks/bench_import.py --budget 1.5 --top 15
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_once(module: str) -> dict:
+    # Clients are created on first use, so importing must not need credentials;
+    # keep worker.py from reading them back out of a local .env
+    env = {k: v for k, v in os.environ.items() if not k.startswith(("SUPABASE_", "OPENROUTER_"))}
+    env["LOAD_DOTENV"] = "0"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        modules.append((name.rstrip(), int(self_us), int(cumulative_us)))
+    total_us = next((c for n, _, c in modules if n.strip() == module), 0)
+    return {"total": total_us / 1e6, "modules": modules, "stdout": proc.stdout}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="worker")
+    parser.add_argument("--budget", type=float, default=1.5, help="seconds")
+    parser.add_argument("--runs", type=int, default=3, help="take the best of this many imports")
+    parser.add_argument("--top", type=int, default=15, help="slowest modules to list")
+    args = parser.parse_args()
+
+    runs = [import_once(args.module) for _ in range(args.runs)]
+    best = min(runs, key=lambda r: r["total"])
+    slowest = sorted(best["modules"], key=lambda m: m[2], reverse=True)
+    # The module's direct imports only (nesting is shown as two spaces per
+    # level), so one heavy dependency isn't listed once per submodule
+    direct = [m for m in slowest if len(m[0]) - len(m[0].lstrip()) == 3]
+
+    report = {
+        "module": args.module,
+        "budget_seconds": args.budget,
+        "import_seconds": {"best": round(best["total"], 3), "all": [round(r["total"], 3) for r in runs]},
+        "slowest_ms": {m[0].strip(): round(m[2] / 1000, 1) for m in direct[:args.top]},
+        "stdout_at_import": best["stdout"].splitlines(),
+    }
+    print(json.dumps(report, indent=2))
+
+    failed = False
+    if best["total"] > args.budget:
+        print(f"FAIL: importing {args.module} took {best['total']:.3f}s, budget {args.budget}s", file=sys.stderr)
+        failed = True
+    if best["stdout"]:
+        print(f"FAIL: importing {args.module} printed to stdout", file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
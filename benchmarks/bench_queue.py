@@ -0,0 +1,89 @@
+"""
+Load test for the job scheduler with a stubbed model backend: many sessions
+each send a burst of messages, the handler sleeps for a simulated generation
+time inside the model's concurrency slot, and we check per-session ordering
+and report throughput and queue wait times.
+
+    python benchmarks/bench_queue.py --sessions 200 --messages 5 --workers 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import JobScheduler
+
+MODELS = ["stub/fast", "stub/slow"]
+
+
+async def run(args):
+    processed: dict[str, list[int]] = {}
+    running_sessions: set[str] = set()
+    overlaps = 0
+
+    async def handler(msg_id, session_id):
+        nonlocal overlaps
+        if session_id in running_sessions:
+            overlaps += 1
+        running_sessions.add(session_id)
+        model = MODELS[msg_id % len(MODELS)]
+        async with scheduler.model_slot(model):
+            await asyncio.sleep(args.latency * random.uniform(0.5, 1.5))
+        processed.setdefault(session_id, []).append(msg_id)
+        running_sessions.discard(session_id)
+
+    scheduler = JobScheduler(
+        handler,
+        workers=args.workers,
+        max_queue=args.sessions * args.messages * 2,
+        model_concurrency=args.model_concurrency,
+        model_limits={},
+    )
+    await scheduler.start()
+
+    total = args.sessions * args.messages
+    start = time.perf_counter()
+    msg_id = 0
+    for _ in range(args.messages):
+        for s in range(args.sessions):
+            scheduler.submit(msg_id, f"session-{s}")
+            # Simulate a redelivered webhook for some messages
+            if random.random() < args.redelivery:
+                scheduler.submit(msg_id, f"session-{s}")
+            msg_id += 1
+
+    while scheduler.counters["completed"] < total:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    await scheduler.stop()
+
+    in_order = all(ids == sorted(ids) for ids in processed.values())
+    report = {
+        "jobs": total,
+        "elapsed_seconds": round(elapsed, 3),
+        "jobs_per_second": round(total / elapsed, 1),
+        "per_session_order_kept": in_order,
+        "concurrent_runs_in_one_session": overlaps,
+        "scheduler": scheduler.stats(),
+    }
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--model-concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated model time in seconds")
+    parser.add_argument("--redelivery", type=float, default=0.1, help="fraction of webhooks delivered twice")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Tail latency and failure rate of route_chat with and without fallback and
+hedging, against the stub provider injecting slow responses and errors.
+
+    python benchmarks/bench_routing.py --requests 200 --slow-rate 0.1 --fail-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_openrouter import StubConfig, start_stub
+
+MESSAGES = [{"role": "user", "content": "ping"}]
+
+
+async def scenario(main, models, hedge, total, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def one():
+        nonlocal failures
+        async with sem:
+            start = time.perf_counter()
+            try:
+                await main.route_chat(MESSAGES, models, deadline=30, hedge=hedge, use_cache=False)
+                latencies.append(time.perf_counter() - start)
+            except main.ModelUnavailable:
+                failures += 1
+
+    await asyncio.gather(*(one() for _ in range(total)))
+    latencies.sort()
+
+    def pct(p):
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1) if latencies else None
+
+    return {"ok": len(latencies), "failed": failures, "p50_ms": pct(0.5), "p95_ms": pct(0.95), "p99_ms": pct(0.99)}
+
+
+async def run(args):
+    import main
+    import openrouter_client
+
+    main.HEDGE_DEFAULT_DELAY = args.hedge_delay
+    report = {
+        "single model": await scenario(main, ["stub/a"], False, args.requests, args.concurrency),
+        "fallback chain": await scenario(main, ["stub/a", "stub/b"], False, args.requests, args.concurrency),
+        "fallback + hedging": await scenario(main, ["stub/a", "stub/b"], True, args.requests, args.concurrency),
+    }
+    await openrouter_client.close_client()
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--slow-rate", type=float, default=0.1)
+    parser.add_argument("--slow-latency", type=float, default=3.0)
+    parser.add_argument("--fail-rate", type=float, default=0.05)
+    parser.add_argument("--hedge-delay", type=float, default=0.3)
+    args = parser.parse_args()
+
+    StubConfig.latency = args.latency
+    StubConfig.slow_rate = args.slow_rate
+    StubConfig.slow_latency = args.slow_latency
+    StubConfig.fail_rate = args.fail_rate
+    server = start_stub()
+    os.environ["OPENROUTER_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/api/v1"
+    os.environ.setdefault("COMPLETION_CACHE", "off")
+    asyncio.run(run(args))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
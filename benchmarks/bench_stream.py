@@ -0,0 +1,57 @@
+"""
+Time-to-first-token for the streaming path versus the buffered path, using
+the stub server in SSE mode.
+
+    python benchmarks/bench_stream.py --chunk-delay 0.05
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_openrouter import StubConfig, start_stub
+
+MESSAGES = [{"role": "user", "content": "ping"}]
+
+
+async def run():
+    import openrouter_client
+
+    start = time.perf_counter()
+    await openrouter_client.chat_completion({"model": "stub/model", "messages": MESSAGES})
+    buffered = time.perf_counter() - start
+
+    start = time.perf_counter()
+    first = None
+    text = []
+    async for delta in openrouter_client.stream_chat_completion({"model": "stub/model", "messages": MESSAGES}):
+        if first is None:
+            first = time.perf_counter() - start
+        text.append(delta)
+    total = time.perf_counter() - start
+    await openrouter_client.close_client()
+
+    assert "".join(text) == StubConfig.reply, "".join(text)
+    print(f"buffered  first token = total : {buffered * 1000:8.1f} ms")
+    print(f"streaming first token         : {first * 1000:8.1f} ms")
+    print(f"streaming total               : {total * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunk-delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    StubConfig.chunk_delay = args.chunk_delay
+    StubConfig.reply = " ".join(f"token{i}" for i in range(40))
+    server = start_stub()
+    os.environ["OPENROUTER_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/api/v1"
+    asyncio.run(run())
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
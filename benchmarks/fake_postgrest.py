@@ -0,0 +1,238 @@
+"""
+Tiny in-memory stand-in for Supabase's PostgREST API, enough for the calls
+db_async.py makes: select/insert/upsert/update/delete on `sessions` and
+`messages` with eq/lt/gt/in filters (also inside or=/and() trees), order on
+one or more columns and limit, plus the RPCs in sql/.
+Every request sleeps for `FakeConfig.latency` to model the network round-trip.
+
+Point db_async at it with SUPABASE_URL=http://127.0.0.1:<port> and any
+JWT-shaped SUPABASE_KEY (e.g. "fake.fake.fake").
+"""
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+
+class FakeConfig:
+    latency = 0.0
+
+
+class FakeStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tables = {"sessions": [], "messages": []}
+        self.next_id = 1
+        self.requests = 0
+
+    def insert_message(self, row: dict) -> dict:
+        row = {**row, "id": self.next_id, "created_at": datetime.now(timezone.utc).isoformat()}
+        self.next_id += 1
+        self.tables["messages"].append(row)
+        return row
+
+    def upsert_session(self, row: dict) -> dict:
+        for existing in self.tables["sessions"]:
+            if existing["session_id"] == row["session_id"]:
+                existing.update(row)
+                return existing
+        row = {"title": "New Chat", "created_at": datetime.now(timezone.utc).isoformat(), **row}
+        self.tables["sessions"].append(row)
+        return row
+
+
+store = FakeStore()
+
+
+def _split(expr: str) -> list[str]:
+    """Split "a.eq.1,and(b.eq.2,c.lt.3)" on its top-level commas."""
+    parts, depth, quoted, start = [], 0, False, 0
+    for i, ch in enumerate(expr):
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        elif not quoted and ch == "," and depth == 0:
+            parts.append(expr[start:i])
+            start = i + 1
+    parts.append(expr[start:])
+    return parts
+
+
+def _parse_filter(name: str, value: str):
+    if name in ("or", "and"):
+        return (name, None, [_parse_filter(*_split_condition(c)) for c in _split(value[1:-1])])
+    op, _, operand = value.partition(".")
+    return (name, op, operand.strip('"'))
+
+
+def _split_condition(condition: str) -> tuple[str, str]:
+    if condition.startswith(("or(", "and(")):
+        name, _, rest = condition.partition("(")
+        return name, "(" + rest
+    name, _, rest = condition.partition(".")
+    return name, rest
+
+
+def _matches(row: dict, filters: list) -> bool:
+    for column, op, value in filters:
+        if column == "or":
+            if not any(_matches(row, [f]) for f in value):
+                return False
+            continue
+        if column == "and":
+            if not _matches(row, value):
+                return False
+            continue
+        current = row.get(column)
+        if op == "eq" and str(current) != value:
+            return False
+        if op == "lt" and not current < type(current)(value):
+            return False
+        if op == "gt" and not current > type(current)(value):
+            return False
+        if op == "in" and str(current) not in value.strip("()").split(","):
+            return False
+    return True
+
+
+def _timestamp(value: str) -> float:
+    return datetime.fromisoformat(value).timestamp()
+
+
+def _claimed_at(row: dict) -> float:
+    # coalesce(claimed_at, created_at), as in sql/004
+    return _timestamp(row.get("claimed_at") or row["created_at"])
+
+
+def _claim(row: dict, owner: str):
+    row.update(state="Processing", claimed_by=owner, claimed_at=datetime.now(timezone.utc).isoformat())
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _parse(self):
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")   # rest/v1/<table> or rest/v1/rpc/<fn>
+        params = parse_qsl(url.query)
+        filters, order, limit = [], [], None
+        for name, value in params:
+            if name == "order":
+                for key in value.split(","):
+                    column, _, direction = key.partition(".")
+                    order.append((column, direction.startswith("desc")))
+            elif name == "limit":
+                limit = int(value)
+            elif name != "select" and "." in value or name in ("or", "and"):
+                filters.append(_parse_filter(name, value))
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length)) if length else None
+        return parts, filters, order, limit, body
+
+    def _reply(self, data, status=200):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self, method):
+        if FakeConfig.latency:
+            time.sleep(FakeConfig.latency)
+        parts, filters, order, limit, body = self._parse()
+        with store.lock:
+            store.requests += 1
+            if parts[2] == "rpc":
+                return self._reply(self._rpc(parts[3], body or {}))
+            table = store.tables[parts[2]]
+            if method == "GET":
+                rows = [r for r in table if _matches(r, filters)]
+                for column, desc in reversed(order):   # stable sorts, last key first
+                    rows.sort(key=lambda r: r.get(column), reverse=desc)
+                return self._reply(rows[:limit] if limit else rows)
+            if method == "POST":
+                rows = body if isinstance(body, list) else [body]
+                if parts[2] == "messages":
+                    return self._reply([store.insert_message(r) for r in rows], 201)
+                return self._reply([store.upsert_session(r) for r in rows], 201)
+            if method == "PATCH":
+                rows = [r for r in table if _matches(r, filters)]
+                for r in rows:
+                    r.update(body)
+                return self._reply(rows)
+            if method == "DELETE":
+                rows = [r for r in table if _matches(r, filters)]
+                store.tables[parts[2]] = [r for r in table if not _matches(r, filters)]
+                return self._reply(rows)
+
+    def _rpc(self, name: str, args: dict):
+        if name == "complete_turn":
+            for r in store.tables["messages"]:
+                if r["id"] == args["p_message_id"]:
+                    r["state"] = "Completed"
+            return [store.insert_message({
+                "session_id": args["p_session_id"], "role": "assistant",
+                "content": args["p_content"], "state": "Completed",
+            })]
+        if name == "record_user_message":
+            store.upsert_session({"session_id": args["p_session_id"], "model": args["p_model"]})
+            return [store.insert_message({
+                "session_id": args["p_session_id"], "role": "User",
+                "content": args["p_content"], "state": "Pending",
+            })]
+        if name == "claim_message":
+            lease_cutoff = time.time() - args["p_lease_seconds"]
+            for r in store.tables["messages"]:
+                if r["id"] == args["p_message_id"] and (
+                    r["state"] == "Pending"
+                    or (r["state"] == "Processing" and (r.get("claimed_by") == args["p_owner"] or _claimed_at(r) < lease_cutoff))
+                ):
+                    _claim(r, args["p_owner"])
+                    return [r]
+            return []
+        if name == "claim_stale_messages":
+            pending_cutoff = time.time() - args["p_pending_seconds"]
+            lease_cutoff = time.time() - args["p_lease_seconds"]
+            stale = [
+                r for r in store.tables["messages"]
+                if (r["state"] == "Pending" and _timestamp(r["created_at"]) < pending_cutoff)
+                or (r["state"] == "Processing" and _claimed_at(r) < lease_cutoff)
+            ][:args["p_limit"]]
+            for r in stale:
+                _claim(r, args["p_owner"])
+            return stale
+        if name == "delete_sessions":
+            ids = set(args["p_session_ids"])
+            store.tables["messages"] = [r for r in store.tables["messages"] if r["session_id"] not in ids]
+            deleted = [r for r in store.tables["sessions"] if r["session_id"] in ids]
+            store.tables["sessions"] = [r for r in store.tables["sessions"] if r["session_id"] not in ids]
+            return [{"session_id": r["session_id"]} for r in deleted]
+        raise KeyError(name)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+def start_fake_postgrest(port: int = 0) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,194 @@
+"""
+End-to-end load test of the chat pipeline, fully offline.
+
+Boots the FastAPI app (worker.py) under uvicorn against the stub OpenRouter
+server and the fake PostgREST server, then drives N concurrent sessions
+through /send-message -> /process-message -> WebSocket delivery and reports
+throughput plus p50/p95/p99 end-to-end latency and time-to-first-token as
+JSON, so runs can be compared.
+
+    python benchmarks/harness.py --sessions 50 --turns 3 --model-latency 0.2 \
+        --chunk-delay 0.01 --out bench_output.json
+
+To compare webhook and direct dispatch, run both with the webhook hop you
+see in production, e.g. `--dispatch webhook --webhook-delay 0.3` against
+`--dispatch direct`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import sys
+import time
+import uuid
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+from stub_openrouter import StubConfig, start_stub
+from fake_postgrest import FakeConfig, start_fake_postgrest, store
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    values = sorted(values)
+
+    def pct(p):
+        return round(values[min(len(values) - 1, int(p * len(values)))] * 1000, 1)
+
+    return {"p50": pct(0.5), "p95": pct(0.95), "p99": pct(0.99), "max": round(values[-1] * 1000, 1)}
+
+
+async def run_session(http, ws_base: str, args, results: dict):
+    import websockets
+
+    session_id = str(uuid.uuid4())
+    async with websockets.connect(f"{ws_base}/ws/{session_id}") as ws:
+        for turn in range(args.turns):
+            start = time.perf_counter()
+            first_token = None
+            res = await http.post("/send-message", json={
+                "session_id": session_id, "content": f"benchmark turn {turn}", "model": "stub/model",
+            })
+            data = res.json()
+            if data.get("status") != "ok":
+                results["errors"] += 1
+                continue
+
+            if args.dispatch == "webhook":
+                # Stand in for the Supabase database webhook hop
+                if args.webhook_delay:
+                    await asyncio.sleep(args.webhook_delay)
+                await http.post("/process-message", json={"record": {
+                    "id": data["msg_id"], "session_id": session_id, "state": "Pending",
+                }})
+
+            while True:
+                try:
+                    frame = json.loads(await asyncio.wait_for(ws.recv(), args.timeout))
+                except asyncio.TimeoutError:
+                    results["timeouts"] += 1
+                    break
+                if frame.get("type") == "delta" and first_token is None:
+                    first_token = time.perf_counter() - start
+                elif frame.get("type") == "message":
+                    results["latency"].append(time.perf_counter() - start)
+                    results["ttft"].append(first_token if first_token is not None else time.perf_counter() - start)
+                    break
+                elif frame.get("type") == "error":
+                    results["errors"] += 1
+                    break
+
+
+async def drive(args, base_url: str, ws_base: str) -> dict:
+    import httpx
+
+    results = {"latency": [], "ttft": [], "errors": 0, "timeouts": 0}
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout) as http:
+        sem = asyncio.Semaphore(args.concurrency)
+
+        async def one():
+            async with sem:
+                await run_session(http, ws_base, args, results)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(args.sessions)))
+        elapsed = time.perf_counter() - start
+
+        stats = (await http.get("/stats")).json()
+
+    completed = len(results["latency"])
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "elapsed_seconds": round(elapsed, 3),
+        "turns_completed": completed,
+        "turns_per_second": round(completed / elapsed, 2) if elapsed else None,
+        "errors": results["errors"],
+        "timeouts": results["timeouts"],
+        "end_to_end_ms": percentiles(results["latency"]),
+        "time_to_first_token_ms": percentiles(results["ttft"]),
+        "db_requests": store.requests,
+        "server_stats": stats,
+    }
+
+
+async def main_async(args):
+    StubConfig.latency = args.model_latency
+    StubConfig.chunk_delay = args.chunk_delay
+    StubConfig.fail_rate = args.error_rate
+    stub = start_stub()
+    FakeConfig.latency = args.db_latency
+    db = start_fake_postgrest()
+
+    os.environ.update({
+        "OPENROUTER_BASE_URL": f"http://127.0.0.1:{stub.server_address[1]}/api/v1",
+        "OPENROUTER_API_KEY": "bench",
+        "SUPABASE_URL": f"http://127.0.0.1:{db.server_address[1]}",
+        "SUPABASE_KEY": "fake.fake.fake",
+        "STREAM_RESPONSES": "1" if args.stream else "0",
+        "MODEL_CATALOG_OFFLINE": "1",
+        "COMPLETION_CACHE": "off",
+        "DELIVERY_BACKEND": "memory",
+        "TITLE_TIMEOUT": "2",
+        "DISPATCH_MODE": args.dispatch,
+        # Every simulated session comes from 127.0.0.1; measure the pipeline, not the limits
+        "ADMISSION_CLIENT_RATE": "0",
+        "ADMISSION_SESSION_RATE": "0",
+    })
+    os.chdir(ROOT)   # worker.py serves the frontend from a relative path
+
+    import uvicorn
+    import worker
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(worker.app, host="127.0.0.1", port=port, log_level="warning"))
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    try:
+        report = await drive(args, f"http://127.0.0.1:{port}", f"ws://127.0.0.1:{port}")
+    finally:
+        server.should_exit = True
+        await serve_task
+        stub.shutdown()
+        db.shutdown()
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=3, help="messages per session")
+    parser.add_argument("--concurrency", type=int, default=20, help="sessions active at once")
+    parser.add_argument("--model-latency", type=float, default=0.1, help="stub time before the first byte (s)")
+    parser.add_argument("--chunk-delay", type=float, default=0.01, help="stub delay between streamed chunks (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub requests answering 502")
+    parser.add_argument("--db-latency", type=float, default=0.005, help="fake PostgREST round-trip (s)")
+    parser.add_argument("--no-stream", dest="stream", action="store_false")
+    parser.add_argument("--dispatch", choices=["webhook", "direct"], default="webhook")
+    parser.add_argument("--webhook-delay", type=float, default=0.0, help="simulated Supabase webhook hop (s)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--out", help="also write the JSON report to this file")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
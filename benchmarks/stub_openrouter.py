@@ -0,0 +1,138 @@
+"""
+Local stand-in for the OpenRouter chat completions API.
+
+Run it standalone (`python benchmarks/stub_openrouter.py --port 8099`) and
+point the app at it with OPENROUTER_BASE_URL=http://127.0.0.1:8099/api/v1,
+or start it in-process from a benchmark with `start_stub()`.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubConfig:
+    latency = 0.0          # seconds to wait before answering
+    chunk_delay = 0.0      # seconds between streamed chunks (stream: true)
+    reply = "Hello from the stub model."
+    # Fault injection, per request: answer with HTTP 502, or stall for
+    # `slow_latency` seconds before the first byte (a slow provider).
+    fail_rate = 0.0
+    rate_limit_rate = 0.0   # answer 429 with Retry-After: 1
+    slow_rate = 0.0
+    slow_latency = 5.0
+    # Overrides of `latency` by model name
+    model_latency: dict[str, float] = {}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, like the real API
+    # Buffer the response so headers and body leave in one write (flushed at
+    # the end of each request, or per chunk when streaming); written
+    # separately, Nagle and delayed ACKs hold every reply back ~40ms.
+    wbufsize = -1
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        latency = StubConfig.model_latency.get(body.get("model"), StubConfig.latency)
+        if random.random() < StubConfig.slow_rate:
+            latency = StubConfig.slow_latency
+        if latency:
+            time.sleep(latency)
+        if random.random() < StubConfig.rate_limit_rate:
+            self._error(429, "Rate limit exceeded", {"Retry-After": "1"})
+            return
+        if random.random() < StubConfig.fail_rate:
+            self._error(502, "Provider returned error")
+            return
+
+        if body.get("stream"):
+            self._stream(body)
+            return
+        if StubConfig.chunk_delay:
+            # A buffered reply still takes as long to generate as a streamed one
+            time.sleep(StubConfig.chunk_delay * len(StubConfig.reply.split(" ")))
+
+        payload = json.dumps({
+            "id": "stub",
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": StubConfig.reply}}],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _error(self, status: int, message: str, headers: dict = None):
+        payload = json.dumps({"error": {"code": status, "message": message}}).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _stream(self, body: dict):
+        """Answer as Server-Sent Events, one word per chunk, like OpenRouter."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._write_chunk(": OPENROUTER PROCESSING\n\n")
+        words = StubConfig.reply.split(" ")
+        for i, word in enumerate(words):
+            text = word if i == 0 else " " + word
+            event = {"model": body.get("model"), "choices": [{"index": 0, "delta": {"content": text}}]}
+            self._write_chunk(f"data: {json.dumps(event)}\n\n")
+            if StubConfig.chunk_delay:
+                time.sleep(StubConfig.chunk_delay)
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text: str):
+        data = text.encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class StubServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 resets connections as soon as a
+    # benchmark opens more than a handful at once
+    request_queue_size = 1024
+
+
+def start_stub(port: int = 0) -> StubServer:
+    """Start the stub in a daemon thread and return the server (port in server_address)."""
+    server = StubServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--chunk-delay", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=5.0)
+    args = parser.parse_args()
+    StubConfig.latency = args.latency
+    StubConfig.chunk_delay = args.chunk_delay
+    StubConfig.fail_rate = args.fail_rate
+    StubConfig.rate_limit_rate = args.rate_limit_rate
+    StubConfig.slow_rate = args.slow_rate
+    StubConfig.slow_latency = args.slow_latency
+    server = StubServer(("127.0.0.1", args.port), StubHandler)
+    print(f"Stub OpenRouter listening on http://127.0.0.1:{args.port}/api/v1")
+    server.serve_forever()
@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# ── Completion cache ─────────────────────────────────────────────────────────
+# Reuses model replies for prompts we have already answered: identical first
+# turns and title requests on the same text. Keys cover the model name, the
+# normalised messages and any request parameters.
+#
+#   COMPLETION_CACHE=off      disabled (default)
+#   COMPLETION_CACHE=memory   in-process LRU
+#   COMPLETION_CACHE=sqlite   on-disk, shared by processes on one box
+
+COMPLETION_CACHE = os.getenv("COMPLETION_CACHE", "off")
+COMPLETION_CACHE_TTL = float(os.getenv("COMPLETION_CACHE_TTL", "86400"))
+COMPLETION_CACHE_SIZE = int(os.getenv("COMPLETION_CACHE_SIZE", "10000"))
+COMPLETION_CACHE_PATH = os.getenv("COMPLETION_CACHE_PATH", "completion_cache.sqlite3")
+
+
+def cache_key(model_name: str, messages: list, params: dict = None) -> str:
+    normalized = [
+        {"role": m["role"].lower(), "content": " ".join(m["content"].split())}
+        for m in messages
+    ]
+    raw = json.dumps([model_name, normalized, params or {}], sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class MemoryStore:
+    blocking = False
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[str, float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """Return (reply, original latency) or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, latency, expires = entry
+            if expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value, latency
+
+    def set(self, key: str, value: str, latency: float):
+        with self._lock:
+            self._entries[key] = (value, latency, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteStore:
+    # Lookups and writes touch the disk, so CompletionCache runs them in a thread
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._touched: dict[str, float] = {}   # key -> last use, written with the next set
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("pragma journal_mode=wal")
+        self._db.execute(
+            "create table if not exists completions ("
+            " key text primary key, value text not null, latency real not null,"
+            " expires real not null, last_used real not null)"
+        )
+        self._db.execute("create index if not exists completions_last_used on completions(last_used)")
+        self._db.commit()
+
+    def get(self, key: str):
+        # Read-only: last_used is batched into the next set() rather than
+        # committed on every hit. Expired rows are pruned there too.
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "select value, latency, expires from completions where key = ?", (key,)
+            ).fetchone()
+            if row is None or row[2] < now:
+                return None
+            self._touched[key] = now
+            return row[0], row[1]
+
+    def set(self, key: str, value: str, latency: float):
+        now = time.time()
+        with self._lock:
+            touched, self._touched = self._touched, {}
+            self._db.executemany(
+                "update completions set last_used = ? where key = ?",
+                [(used, k) for k, used in touched.items()],
+            )
+            self._db.execute(
+                "insert or replace into completions values (?, ?, ?, ?, ?)",
+                (key, value, latency, now + self.ttl, now),
+            )
+            self._db.execute("delete from completions where expires < ?", (now,))
+            self._db.execute(
+                "delete from completions where key in ("
+                " select key from completions order by last_used desc limit -1 offset ?)",
+                (self.max_entries,),
+            )
+            self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("select count(*) from completions").fetchone()[0]
+
+
+class CompletionCache:
+    def __init__(self, store):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    async def _call(self, fn, *args):
+        if self.store.blocking:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    async def get(self, key: str):
+        entry = await self._call(self.store.get, key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.saved_seconds += entry[1]
+        return entry[0]
+
+    async def set(self, key: str, value: str, latency: float):
+        await self._call(self.store.set, key, value, latency)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": COMPLETION_CACHE,
+            "entries": len(self.store),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
+
+
+def create_cache(backend: str = COMPLETION_CACHE):
+    if backend == "off":
+        return None
+    if backend == "memory":
+        return CompletionCache(MemoryStore(COMPLETION_CACHE_SIZE, COMPLETION_CACHE_TTL))
+    if backend == "sqlite":
+        return CompletionCache(SqliteStore(COMPLETION_CACHE_PATH, COMPLETION_CACHE_SIZE, COMPLETION_CACHE_TTL))
+    raise ValueError(f"Unknown COMPLETION_CACHE: {backend}")
+
+
+completion_cache = create_cache()
@@ -0,0 +1,98 @@
+import os
+import uuid
+import asyncio
+from collections import OrderedDict
+
+from db_async import get_chat_history_page, get_messages_between
+from db_init import CONTEXT_COLUMNS
+from main import summarize_chat
+from model_registry import registry
+
+# ── Context builder ──────────────────────────────────────────────────────────
+# Sends the model only the newest messages of a session that fit its context
+# window, instead of the whole history. Older turns can optionally be folded
+# into a rolling summary that is refreshed in the background.
+
+CONTEXT_MAX_MESSAGES = int(os.getenv("CONTEXT_MAX_MESSAGES", "40"))
+# Share of the model's context window the history may use; the rest is left
+# for the reply.
+CONTEXT_BUDGET_RATIO = float(os.getenv("CONTEXT_BUDGET_RATIO", "0.5"))
+CONTEXT_SUMMARY = os.getenv("CONTEXT_SUMMARY", "0") == "1"
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "1024"))
+
+# session_id -> (id of the newest message covered, summary text)
+_summaries: OrderedDict[str, tuple[int, str]] = OrderedDict()
+_refreshing: set[str] = set()
+# Keeps references to the running refreshes so they aren't garbage collected
+_refresh_tasks: set[asyncio.Task] = set()
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token plus per-message overhead
+    return len(text) // 4 + 4
+
+
+async def build_context(session_id: uuid.UUID, model_name: str) -> list[dict]:
+    """Return the chat completion `messages` list for the next reply."""
+    messages, next_before = await get_chat_history_page(session_id, None, CONTEXT_MAX_MESSAGES, CONTEXT_COLUMNS)
+
+    budget = int(registry.context_length(model_name) * CONTEXT_BUDGET_RATIO)
+    summary = _summaries.get(str(session_id)) if CONTEXT_SUMMARY else None
+    if summary:
+        budget -= estimate_tokens(summary[1])
+
+    # Walk back from the newest message until the budget is used up, always
+    # keeping the latest message.
+    kept = []
+    used = 0
+    for msg in reversed(messages):
+        cost = estimate_tokens(msg["content"])
+        if kept and used + cost > budget:
+            break
+        kept.append(msg)
+        used += cost
+    kept.reverse()
+
+    trimmed = next_before is not None or len(kept) < len(messages)
+    if CONTEXT_SUMMARY and trimmed and kept:
+        _schedule_summary_refresh(session_id, kept[0]["id"])
+
+    query = [{"role": msg["role"].lower(), "content": msg["content"]} for msg in kept]
+    if summary:
+        query.insert(0, {"role": "system", "content": f"Summary of the earlier conversation:\n{summary[1]}"})
+    return query
+
+
+def _schedule_summary_refresh(session_id: uuid.UUID, oldest_kept_id: int):
+    key = str(session_id)
+    covered = _summaries.get(key, (None, ""))[0]
+    if key in _refreshing or (covered is not None and covered >= oldest_kept_id - 1):
+        return
+    _refreshing.add(key)
+    task = asyncio.create_task(_refresh_summary(session_id, oldest_kept_id))
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+
+
+async def _refresh_summary(session_id: uuid.UUID, oldest_kept_id: int):
+    """Fold the messages between the last summary and the context window into it."""
+    key = str(session_id)
+    try:
+        covered, previous = _summaries.get(key, (None, ""))
+        older = await get_messages_between(session_id, covered, oldest_kept_id, CONTEXT_COLUMNS)
+        if not older:
+            return
+        summary = await summarize_chat(previous, older)
+        if summary:
+            _summaries[key] = (older[-1]["id"], summary)
+            _summaries.move_to_end(key)
+            while len(_summaries) > SUMMARY_CACHE_SIZE:
+                _summaries.popitem(last=False)
+    except Exception as e:
+        print(f"Summary refresh failed for session {session_id}: {e}")
+    finally:
+        _refreshing.discard(key)
+
+
+def forget_session(session_id: uuid.UUID):
+    _summaries.pop(str(session_id), None)
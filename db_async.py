@@ -0,0 +1,533 @@
+import os
+import time
+import uuid
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING
+
+from db_init import (
+    session_list_cache, session_list_cursor, after_session_list_cursor,
+    INSTANCE_ID, MESSAGE_LEASE_SECONDS, LEASES_TRACKED, leased_at
+)
+
+if TYPE_CHECKING:
+    from supabase import AsyncClient
+
+# ── Async data access ────────────────────────────────────────────────────────
+# Every Supabase query, on supabase's AsyncClient so the FastAPI app can await
+# Supabase on the event loop instead of parking a threadpool thread per call.
+# One client (and so one HTTP connection pool) per process, created on first
+# use and closed by the app's lifespan. Settings and caches are in db_init.
+
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+
+_client: "AsyncClient | None" = None
+_client_lock = asyncio.Lock()
+
+
+async def get_client() -> "AsyncClient":
+    global _client
+    if _client is not None:
+        return _client
+    async with _client_lock:
+        if _client is None:
+            # supabase takes about a second to import; only pay it on first use
+            from supabase import acreate_client
+            from supabase.lib.client_options import AsyncClientOptions
+            _client = await acreate_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"), options=AsyncClientOptions(
+                postgrest_client_timeout=SUPABASE_TIMEOUT,
+                storage_client_timeout=SUPABASE_TIMEOUT,
+            ))
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        try:
+            await _client.postgrest.aclose()
+        except Exception as E:
+            print(f"Closing the Supabase client failed: {E}")
+        _client = None
+
+
+async def ping():
+    """Cheapest query that proves the database answers; raises if it doesn't."""
+    supabase = await get_client()
+    await supabase.table("sessions").select("session_id").limit(1).execute()
+
+
+async def send_message_to_db(session_id: uuid.UUID, role:str, message: str, state:str):
+    supabase = await get_client()
+    try:
+        response = await (
+            supabase.table("messages")
+            .insert({
+                "session_id": str(session_id),
+                "role": role,
+                "content": message,
+                "state": state
+            })
+            .execute()
+        )
+        return response
+    except Exception as E:
+        print(E)
+        return None
+
+
+async def complete_turn(message_id: int, session_id: uuid.UUID, content: str):
+    """
+    Mark the user's message Completed and insert the assistant reply in one
+    round-trip (complete_turn RPC, see sql/002_batched_turn_writes.sql).
+    Falls back to two separate writes if the function isn't deployed.
+    """
+    supabase = await get_client()
+    try:
+        response = await supabase.rpc("complete_turn", {
+            "p_message_id": message_id,
+            "p_session_id": str(session_id),
+            "p_content": content,
+        }).execute()
+    except Exception as E:
+        print(f"complete_turn RPC failed ({E}), falling back to separate writes")
+        await update_message_state(message_id, "Completed")
+        return await send_message_to_db(session_id, "assistant", content, "Completed")
+    return response
+
+
+async def record_user_message(session_id: uuid.UUID, model: str, content: str):
+    """
+    Create the session if needed, switch its model if it changed, and insert
+    the Pending user message in one round-trip (record_user_message RPC).
+    Falls back to the lookup + upsert + insert sequence if it isn't deployed.
+    """
+    supabase = await get_client()
+    try:
+        response = await supabase.rpc("record_user_message", {
+            "p_session_id": str(session_id),
+            "p_model": model,
+            "p_content": content,
+        }).execute()
+    except Exception as E:
+        print(f"record_user_message RPC failed ({E}), falling back to separate writes")
+        existing = await get_session(session_id)
+        if not existing:
+            await create_session(session_id, "New Chat", model)
+        elif existing.get("model") != model:
+            await update_session_model(session_id, model)
+        return await send_message_to_db(session_id, "User", content, "Pending")
+
+    session_list_cache.invalidate_unless_listed(session_id)
+    return response
+
+
+async def get_chat_history(session_id: uuid.UUID):
+    supabase = await get_client()
+    try:
+        response = await (
+            supabase.table("messages")
+            .select("*")
+            .eq("session_id", str(session_id))
+            .order("created_at", desc=False)
+            .execute()
+        )
+        return response.data
+    except Exception as E:
+        print(E)
+        return None
+
+
+async def get_chat_history_page(session_id: uuid.UUID, before: int = None, limit: int = 50, columns: str = "*"):
+    """
+    Newest `limit` messages with id < `before` (or the newest overall), in
+    chronological order. Returns (messages, next_before) where next_before is
+    the cursor for the next older page, or None when there is nothing older.
+    `columns` (which must include id) limits the fields returned.
+    """
+    supabase = await get_client()
+    try:
+        query = (
+            supabase.table("messages")
+            .select(columns)
+            .eq("session_id", str(session_id))
+        )
+        if before is not None:
+            query = query.lt("id", before)
+        response = await query.order("id", desc=True).limit(limit + 1).execute()
+    except Exception as E:
+        print(E)
+        return [], None
+    has_more = len(response.data) > limit
+    page = list(reversed(response.data[:limit]))
+
+    next_before = page[0]["id"] if has_more and page else None
+    return page, next_before
+
+
+async def get_messages_between(session_id: uuid.UUID, after: int = None, before: int = None, columns: str = "*"):
+    """Messages with after < id < before, oldest first (either bound optional)."""
+    supabase = await get_client()
+    try:
+        query = (
+            supabase.table("messages")
+            .select(columns)
+            .eq("session_id", str(session_id))
+        )
+        if after is not None:
+            query = query.gt("id", after)
+        if before is not None:
+            query = query.lt("id", before)
+        return (await query.order("id", desc=False).execute()).data
+    except Exception as E:
+        print(E)
+        return []
+
+
+async def get_chat_titles():
+    supabase = await get_client()
+    try:
+        response = await (
+            supabase.table("sessions")
+            .select("session_id")
+            .execute()
+        )
+        # Extract just the session_id values into a list
+        session_ids = [session["session_id"] for session in response.data]
+        return session_ids
+    except Exception as E:
+        print(E)
+        return None
+
+
+async def create_session(session_id: uuid.UUID, title: str, model: str):
+    supabase = await get_client()
+    try:
+        response = await (
+            supabase.table("sessions")
+            .upsert({
+                "session_id": str(session_id),
+                "title": title,
+                "model": model
+            })
+            .execute()
+        )
+        session_list_cache.invalidate()
+        return response
+    except Exception as E:
+        print(E)
+        return None
+
+
+async def update_session_title(session_id: uuid.UUID, title: str):
+    supabase = await get_client()
+    try:
+        response = await (
+            supabase.table("sessions")
+            .update({"title": title})
+            .eq("session_id", str(session_id))
+            .execute()
+        )
+        session_list_cache.invalidate()
+        return response
+    except Exception as E:
+        print(E)
+        return None
+
+
+async def update_session_model(session_id: uuid.UUID, model: str):
+    supabase = await get_client()
+    try:
+        response = await (
+            supabase.table("sessions")
+            .update({"model": model})
+            .eq("session_id", str(session_id))
+            .execute()
+        )
+        return response
+    except Exception as E:
+        print(E)
+        return None
+
+
+async def update_session_cache(session_id: uuid.UUID, enabled: bool):
+    supabase = await get_client()
+    try:
+        response = await (
+            supabase.table("sessions")
+            .update({"use_cache": enabled})
+            .eq("session_id", str(session_id))
+            .execute()
+        )
+        return response
+    except Exception as E:
+        print(E)
+        return None
+
+
+async def update_session_fallbacks(session_id: uuid.UUID, fallback_models: list[str]):
+    supabase = await get_client()
+    try:
+        response = await (
+            supabase.table("sessions")
+            .update({"fallback_models": fallback_models})
+            .eq("session_id", str(session_id))
+            .execute()
+        )
+        return response
+    except Exception as E:
+        print(E)
+        return None
+
+
+async def get_session(session_id: uuid.UUID):
+    supabase = await get_client()
+    try:
+        response = await (
+            supabase.table("sessions")
+            .select("*")
+            .eq("session_id", str(session_id))
+            .execute()
+        )
+        if not response.data:
+            return None
+        return response.data[0]
+    except Exception as E:
+        print(E)
+        return None
+
+
+async def delete_session(session_id: uuid.UUID):
+    return await delete_sessions([session_id])
+
+
+async def delete_sessions(session_ids: list[uuid.UUID]):
+    """
+    Delete sessions and their messages in one transaction (delete_sessions
+    RPC with the cascade from sql/006_session_delete_cascade.sql). Returns
+    the ids that were deleted, or None on failure. Falls back to deleting the
+    messages and then the sessions if the function isn't deployed.
+    """
+    ids = [str(session_id) for session_id in session_ids]
+    supabase = await get_client()
+    try:
+        try:
+            response = await supabase.rpc("delete_sessions", {"p_session_ids": ids}).execute()
+            return [row["session_id"] for row in response.data or []]
+        except Exception as E:
+            print(f"delete_sessions RPC failed ({E}), falling back to separate deletes")
+        await supabase.table("messages").delete().in_("session_id", ids).execute()
+        response = await supabase.table("sessions").delete().in_("session_id", ids).execute()
+        return [row["session_id"] for row in response.data or []]
+    except Exception as E:
+        print(E)
+        return None
+    finally:
+        session_list_cache.invalidate()
+
+
+async def get_sessions():
+    supabase = await get_client()
+    try:
+        response = await (
+            supabase.table("sessions")
+            .select("title, session_id")
+            .order("created_at", desc=True)
+            .execute()
+        )
+        return response.data
+    except Exception as E:
+        print(E)
+        return []
+
+
+async def get_sessions_page(after: str = None, limit: int = 50):
+    """
+    Newest `limit` sessions after the `after` cursor (from a previous page's
+    next_after), or the newest overall. Returns (sessions, next_after, etag); next_after is
+    None on the last page. Pages come from session_list_cache when possible.
+    """
+    cached = session_list_cache.get(after, limit)
+    if cached is not None:
+        return cached
+    supabase = await get_client()
+    try:
+        query = supabase.table("sessions").select("title, session_id, created_at")
+        if after is not None:
+            query = after_session_list_cursor(query, after)
+        response = await (
+            query.order("created_at", desc=True)
+            .order("session_id", desc=True)
+            .limit(limit + 1)
+            .execute()
+        )
+    except Exception as E:
+        print(E)
+        return [], None, None
+    sessions = response.data[:limit]
+    next_after = session_list_cursor(sessions[-1]) if len(response.data) > limit else None
+    etag = session_list_cache.put(after, limit, sessions, next_after)
+    return sessions, next_after, etag
+
+
+async def update_message_state(message_id: int, state: str):
+    supabase = await get_client()
+    try:
+        response = await (
+            supabase.table("messages")
+            .update({"state": state})
+            .eq("id", message_id)
+            .execute()
+        )
+        return response
+    except Exception as E:
+        print(E)
+        return None
+
+
+async def cancel_turn(message_id: int, session_id: uuid.UUID, partial: str = ""):
+    """
+    Mark the user's message Cancelled and keep whatever part of the reply was
+    generated before the cancel as an assistant message, also Cancelled.
+    """
+    await update_message_state(message_id, "Cancelled")
+    if partial:
+        return await send_message_to_db(session_id, "assistant", partial, "Cancelled")
+    return None
+
+
+async def message_in_session(message_id: int, session_id: uuid.UUID) -> bool:
+    """True if the message exists and belongs to the session."""
+    supabase = await get_client()
+    try:
+        response = await (
+            supabase.table("messages")
+            .select("id")
+            .eq("id", message_id)
+            .eq("session_id", str(session_id))
+            .limit(1)
+            .execute()
+        )
+        return bool(response.data)
+    except Exception as E:
+        print(E)
+        return False
+
+
+def _note_lease(message_id: int):
+    leased_at[message_id] = time.monotonic()
+    leased_at.move_to_end(message_id)
+    while len(leased_at) > LEASES_TRACKED:
+        leased_at.popitem(last=False)
+
+
+async def _lease_rpc(message_id: int):
+    supabase = await get_client()
+    response = await supabase.rpc("claim_message", {
+        "p_message_id": message_id,
+        "p_owner": INSTANCE_ID,
+        "p_lease_seconds": int(MESSAGE_LEASE_SECONDS),
+    }).execute()
+    if response.data:
+        _note_lease(message_id)
+    else:
+        leased_at.pop(message_id, None)
+    return response
+
+
+async def claim_message(message_id: int) -> bool:
+    """
+    Take the lease on a message before queueing it. Only one instance can
+    hold it, so a message dispatched directly, redelivered by the webhook and
+    picked up by the recovery sweeper is still processed once. Returns True
+    if this instance owns it.
+    Uses the claim_message RPC (sql/004_message_leases.sql); without it, falls
+    back to a conditional Pending -> Processing update with no lease.
+    """
+    supabase = await get_client()
+    try:
+        response = await _lease_rpc(message_id)
+    except Exception as E:
+        print(f"claim_message RPC failed ({E}), falling back to a conditional update")
+        try:
+            response = await (
+                supabase.table("messages")
+                .update({"state": "Processing"})
+                .eq("id", message_id)
+                .eq("state", "Pending")
+                .execute()
+            )
+        except Exception as E:
+            print(E)
+            return True   # can't tell; processing twice beats dropping the message
+    if not response.data:
+        return False
+    _note_lease(message_id)
+    return True
+
+
+async def renew_message_lease(message_id: int) -> bool:
+    """
+    Extend this instance's lease on a message it claimed, so neither a wait in
+    the job queue nor a long reply lets the sweeper hand it to another
+    instance. Returns False if the message is finished or someone else holds
+    it. Free while the lease is less than a third used; without the
+    claim_message RPC there is no lease to renew.
+    """
+    leased = leased_at.get(message_id)
+    if leased is not None and time.monotonic() - leased < MESSAGE_LEASE_SECONDS / 3:
+        return True
+    try:
+        response = await _lease_rpc(message_id)
+    except Exception as E:
+        print(f"claim_message RPC failed ({E}), lease on message {message_id} not renewed")
+        _note_lease(message_id)   # try again in a third of the lease, not on every token
+        return True
+    return bool(response.data)
+
+
+async def claim_stale_messages(pending_seconds: float, limit: int = 100) -> list[dict]:
+    """
+    Claim up to `limit` messages that are stuck: Pending for longer than
+    `pending_seconds` (never claimed, e.g. the webhook was lost), or
+    Processing under an expired lease. Oldest first. Without the
+    claim_stale_messages RPC, only the stale Pending rows are claimed, with a
+    conditional Pending -> Processing update.
+    """
+    supabase = await get_client()
+    try:
+        response = await supabase.rpc("claim_stale_messages", {
+            "p_owner": INSTANCE_ID,
+            "p_pending_seconds": int(pending_seconds),
+            "p_lease_seconds": int(MESSAGE_LEASE_SECONDS),
+            "p_limit": limit,
+        }).execute()
+        for row in response.data or []:
+            _note_lease(row["id"])
+        return response.data or []
+    except Exception as E:
+        print(f"claim_stale_messages RPC failed ({E}), falling back to a select")
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=pending_seconds)
+    try:
+        response = await (
+            supabase.table("messages")
+            .select("id, session_id, state, created_at")
+            .eq("state", "Pending")
+            .lt("created_at", cutoff.isoformat())
+            .order("created_at")
+            .limit(limit)
+            .execute()
+        )
+        if not response.data:
+            return []
+        response = await (
+            supabase.table("messages")
+            .update({"state": "Processing"})
+            .in_("id", [row["id"] for row in response.data])
+            .eq("state", "Pending")
+            .execute()
+        )
+        return response.data or []
+    except Exception as E:
+        print(E)
+        return []
\ No newline at end of file
@@ -1,128 +1,118 @@
 import os
-from supabase import create_client, Client
-from dotenv import load_dotenv
+import json
+import time
+import socket
+import hashlib
+import threading
+from datetime import datetime
+from collections import OrderedDict
 import uuid
-load_dotenv()
-url: str = os.getenv("SUPABASE_URL")
-key: str = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
-
-def send_message_to_db(session_id: uuid.UUID, role:str, message: str, state:str):
-    try:
-        response = (
-            supabase.table("messages")
-            .insert({
-                "session_id": str(session_id),
-                "role": role,
-                "content": message,
-                "state": state
-            })
-            .execute()
-        )
-        return response
-    except Exception as E:
-        print(E)
-        return None
-
-
-def get_chat_history(session_id: uuid.UUID):
-    try:
-        response = (
-            supabase.table("messages")
-            .select("*")
-            .eq("session_id", str(session_id))
-            .order("created_at", desc=False)
-            .execute()
-        )
-        return response.data
-    except Exception as E:
-        print(E)
-        return None
-
-
-def get_chat_titles():
-    try:
-        response = (
-            supabase.table("sessions")
-            .select("session_id")
-            .execute()
-        )
-        # Extract just the session_id values into a list
-        session_ids = [session["session_id"] for session in response.data]
-        return session_ids
-    except Exception as E:
-        print(E)
-        return None
-
-
-def create_session(session_id: uuid.UUID, title: str, model: str):
-    try:
-        response = (
-            supabase.table("sessions")
-            .upsert({
-                "session_id": str(session_id),
-                "title": title,
-                "model": model
-            })
-            .execute()
-        )
-        return response
-    except Exception as E:
-        print(E)
-        return None
-
-
-def update_session_title(session_id: uuid.UUID, title: str):
-    try:
-        response = (
-            supabase.table("sessions")
-            .update({"title": title})
-            .eq("session_id", str(session_id))
-            .execute()
-        )
-        return response
-    except Exception as E:
-        print(E)
-        return None
-
-
-def update_session_model(session_id: uuid.UUID, model: str):
-    try:
-        response = (
-            supabase.table("sessions")
-            .update({"model": model})
-            .eq("session_id", str(session_id))
-            .execute()
-        )
-        return response
-    except Exception as E:
-        print(E)
-        return None
-
-
-def get_sessions():
-    try:
-        response = (
-            supabase.table("sessions")
-            .select("title, session_id")
-            .order("created_at", desc=True)
-            .execute()
-        )
-        return response.data
-    except Exception as E:
-        print(E)
-        return []
-
-
-def update_message_state(message_id: int, state: str):
-    try:
-        response = (
-            supabase.table("messages")
-            .update({"state": state})
-            .eq("id", message_id)
-            .execute()
-        )
-        return response
-    except Exception as E:
-        print(E)
-        return None
\ No newline at end of file
+
+# Settings and in-process caches shared by the data layer. The queries
+# themselves live in db_async.py.
+
+
+# ── Session list cache ───────────────────────────────────────────────────────
+# Pages of the sidebar listing keyed by (after, limit), each with an ETag over
+# its contents. Creating, renaming or deleting a session through db_async
+# drops them all; the TTL bounds staleness from other processes.
+
+SESSION_LIST_CACHE_TTL = float(os.getenv("SESSION_LIST_CACHE_TTL", "60"))
+
+
+class SessionListCache:
+    def __init__(self, ttl: float, max_pages: int = 64):
+        self.ttl = ttl
+        self.max_pages = max_pages
+        self.hits = 0
+        self.misses = 0
+        self._pages: OrderedDict[tuple, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, after, limit: int):
+        """Return (sessions, next_after, etag) for a cached page, or None."""
+        with self._lock:
+            entry = self._pages.get((after, limit))
+            if entry is None or entry[3] < time.monotonic():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0], entry[1], entry[2]
+
+    def put(self, after, limit: int, sessions: list, next_after) -> str:
+        digest = hashlib.sha256(json.dumps([sessions, next_after], sort_keys=True, default=str).encode())
+        etag = f'"{digest.hexdigest()[:32]}"'
+        with self._lock:
+            self._pages[(after, limit)] = (sessions, next_after, etag, time.monotonic() + self.ttl)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        return etag
+
+    def invalidate(self):
+        with self._lock:
+            self._pages.clear()
+
+    def invalidate_unless_listed(self, session_id):
+        """Drop the pages unless the session is already on one of them (i.e. it isn't new)."""
+        key = str(session_id)
+        with self._lock:
+            for sessions, *_ in self._pages.values():
+                if any(s["session_id"] == key for s in sessions):
+                    return
+            self._pages.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "pages": len(self._pages),
+        }
+
+
+session_list_cache = SessionListCache(SESSION_LIST_CACHE_TTL)
+
+
+# Sidebar pages are ordered by (created_at, session_id), newest first, and the
+# `after` cursor carries both so sessions sharing a timestamp aren't skipped
+# at a page boundary (see sql/007_sessions_listing_keyset.sql).
+
+def session_list_cursor(row: dict) -> str:
+    return f"{row['created_at']}|{row['session_id']}"
+
+
+def after_session_list_cursor(query, after: str):
+    """Restrict a sessions select to the rows that follow `after`."""
+    created_at, _, session_id = after.partition("|")
+    # Re-serialise both halves so nothing from the client reaches the filter verbatim
+    created_at = datetime.fromisoformat(created_at).isoformat()
+    if not session_id:   # cursor from before session_id was added
+        return query.lt("created_at", created_at)
+    session_id = str(uuid.UUID(session_id))
+    return query.or_(
+        f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",session_id.lt.{session_id})'
+    )
+
+
+# ── Message leases ───────────────────────────────────────────────────────────
+# A message is leased to one instance when it is queued (see claim_message),
+# and the lease is renewed when its job starts and while the reply streams.
+# Leases last MESSAGE_LEASE_SECONDS, so an instance that dies only holds its
+# messages that long; a buffered (non-streamed) reply must finish within it.
+
+INSTANCE_ID = os.getenv("INSTANCE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+MESSAGE_LEASE_SECONDS = float(os.getenv("MESSAGE_LEASE_SECONDS", "300"))
+
+# message id -> when this instance last took or renewed its lease (monotonic),
+# so renewing a fresh lease doesn't cost a round-trip
+LEASES_TRACKED = 10000
+leased_at: OrderedDict[int, float] = OrderedDict()
+
+
+# ── Projections ──────────────────────────────────────────────────────────────
+# Column sets for message reads, so each caller fetches only what it uses.
+
+CONTEXT_COLUMNS = "id, role, content"                      # model prompts
+HISTORY_COLUMNS = "id, role, content, state, created_at"   # rendering a chat
+STATUS_COLUMNS = "id, state, created_at"                   # refreshing message states
@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import asyncio
+from collections import OrderedDict, deque
+
+# ── WebSocket delivery ───────────────────────────────────────────────────────
+# Replies are published through a broker instead of written straight to the
+# socket, so whichever process handled the webhook can reach a browser that is
+# connected to a different worker or box. Every process subscribes and hands
+# frames for sessions it holds to its local `deliver` callback.
+#
+#   DELIVERY_BACKEND=memory   single process (default)
+#   DELIVERY_BACKEND=redis    any number of processes sharing REDIS_URL
+#
+# Every frame gets a per-session sequence number (`seq`) when it is published.
+# Counters start from the clock in microseconds, so they keep increasing across
+# restarts and evictions, and each process keeps the latest frames per
+# session in an Outbox so a client that reconnects can be sent what it missed.
+
+DELIVERY_BACKEND = os.getenv("DELIVERY_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+DELIVERY_CHANNEL = os.getenv("DELIVERY_CHANNEL", "chat-delivery")
+OUTBOX_SIZE = int(os.getenv("OUTBOX_SIZE", "50"))   # frames kept per session
+OUTBOX_SESSIONS = int(os.getenv("OUTBOX_SESSIONS", "10000"))
+OUTBOX_TTL = float(os.getenv("OUTBOX_TTL", "600"))
+
+# Frames that are only useful live. They are numbered but not kept for replay:
+# the final "message" frame carries the full text of a streamed reply.
+TRANSIENT_FRAMES = {"delta"}
+
+
+def _seq_seed() -> int:
+    return time.time_ns() // 1000
+
+
+class Outbox:
+    """The last `size` replayable frames of each session, for resuming clients."""
+
+    def __init__(self, size: int = OUTBOX_SIZE, max_sessions: int = OUTBOX_SESSIONS, ttl: float = OUTBOX_TTL):
+        self.size = size
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: OrderedDict[str, dict] = OrderedDict()
+
+    def record(self, session_id: str, payload: dict):
+        if "seq" not in payload or payload.get("type") in TRANSIENT_FRAMES:
+            return
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            entry = self._sessions[session_id] = {"frames": deque(), "dropped": 0}
+        self._sessions.move_to_end(session_id)
+        entry["expires"] = time.monotonic() + self.ttl
+        entry["frames"].append(payload)
+        if len(entry["frames"]) > self.size:
+            entry["dropped"] = entry["frames"].popleft()["seq"]
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def since(self, session_id: str, last_seq: int) -> list[dict] | None:
+        """
+        Frames newer than `last_seq`, oldest first, or None if this process
+        can't vouch for the gap (frames were dropped, or it holds nothing for
+        the session, e.g. after a restart) and the client should resync.
+        """
+        entry = self._sessions.get(session_id)
+        if entry is None or entry["expires"] < time.monotonic():
+            self._sessions.pop(session_id, None)
+            return None
+        if last_seq < entry["dropped"]:
+            return None
+        return [f for f in entry["frames"] if f["seq"] > last_seq]
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "frames": sum(len(e["frames"]) for e in self._sessions.values()),
+        }
+
+
+class InMemoryBroker:
+    """Delivers within this process only."""
+
+    def __init__(self):
+        self._deliver = None
+        self._seqs: OrderedDict[str, int] = OrderedDict()
+
+    async def start(self, deliver):
+        """`deliver(session_id, payload) -> bool` sends to a local socket if there is one."""
+        self._deliver = deliver
+
+    async def stop(self):
+        pass
+
+    async def ping(self):
+        return True
+
+    def _next_seq(self, session_id: str) -> int:
+        seq = self._seqs[session_id] + 1 if session_id in self._seqs else _seq_seed()
+        self._seqs[session_id] = seq
+        self._seqs.move_to_end(session_id)
+        while len(self._seqs) > OUTBOX_SESSIONS:
+            self._seqs.popitem(last=False)
+        return seq
+
+    async def publish(self, session_id: str, payload: dict):
+        session_id = str(session_id)
+        payload = {**payload, "seq": self._next_seq(session_id)}
+        # Transient frames aren't kept, and a streamed reply sends dozens
+        if not await self._deliver(session_id, payload) and payload.get("type") not in TRANSIENT_FRAMES:
+            print(f"No active WS for session {session_id}, kept for resume")
+
+
+# Number and publish a frame in one round-trip. The counter is seeded from the
+# clock (ARGV[3]) when missing and expires with the outbox. Redis' Lua 5.1
+# would concatenate a 16-digit number as "1.7922825156521e+15", so the seq is
+# formatted with %d.
+_PUBLISH_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  redis.call('SET', KEYS[1], ARGV[3])
+end
+local seq = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('PUBLISH', ARGV[1], '{"session_id":' .. ARGV[2] .. ',"seq":' .. string.format('%d', seq) .. ',"payload":' .. ARGV[5] .. '}')
+return seq
+"""
+
+
+class RedisBroker:
+    """Fans frames out to every process through one Redis pub/sub channel."""
+
+    def __init__(self, url: str = REDIS_URL, channel: str = DELIVERY_CHANNEL):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("DELIVERY_BACKEND=redis needs the redis package: pip install redis")
+        self._redis = redis.from_url(url)
+        self._channel = channel
+        self._publish = self._redis.register_script(_PUBLISH_SCRIPT)
+        self._deliver = None
+        self._listener: asyncio.Task | None = None
+
+    async def start(self, deliver):
+        self._deliver = deliver
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(self._channel)
+        self._listener = asyncio.create_task(self._listen(pubsub))
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+        await self._redis.aclose()
+
+    async def ping(self):
+        await self._redis.ping()
+        if self._listener is None or self._listener.done():
+            raise RuntimeError("pub/sub listener is not running")
+
+    async def publish(self, session_id: str, payload: dict):
+        await self._publish(
+            keys=[f"{self._channel}:seq:{session_id}"],
+            args=[self._channel, json.dumps(str(session_id)), _seq_seed(), int(OUTBOX_TTL), json.dumps(payload)],
+        )
+
+    async def _listen(self, pubsub):
+        while True:
+            try:
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    frame = json.loads(message["data"])
+                    await self._deliver(frame["session_id"], {**frame["payload"], "seq": frame["seq"]})
+            except asyncio.CancelledError:
+                await pubsub.aclose()
+                raise
+            except Exception as e:
+                print(f"Delivery listener error: {e}, resubscribing")
+                await asyncio.sleep(1)
+                pubsub = self._redis.pubsub()
+                await pubsub.subscribe(self._channel)
+
+
+def create_broker(backend: str = DELIVERY_BACKEND):
+    if backend == "memory":
+        return InMemoryBroker()
+    if backend == "redis":
+        return RedisBroker()
+    raise ValueError(f"Unknown DELIVERY_BACKEND: {backend}")
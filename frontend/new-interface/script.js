@@ -9,6 +9,14 @@ let sessionId    = null;
 let currentModel = 'openai/gpt-4.1-mini';
 let ws           = null;
 let isWaiting    = false;   // true while waiting for assistant response
+let pendingMsgId = null;    // id of the message whose reply we're waiting for
+let streamText   = '';      // assistant text received so far via delta frames
+let historyCursor = null;   // `before` cursor for the next older history page
+let loadingOlder  = false;
+let sessionsCursor  = null;   // `after` cursor for the next sidebar page
+let lastSeq       = null;   // seq of the last frame received (null: unknown), sent on reconnect
+let wsWatchdog    = null;
+let loadingSessions = false;
 
 // ── DOM refs ─────────────────────────────────────────────────────────────────
 const chatBox          = document.getElementById('chat-box');
@@ -31,11 +39,24 @@ const chatContainer    = document.querySelector('.chat-container');
 const sidebar          = document.querySelector('.sidebar');
 
 // ── Init ─────────────────────────────────────────────────────────────────────
-// Fetches available models, creates a new session, and loads past sessions.
+// Loads the model catalog and the first page of past sessions in one request
+// (falling back to separate ones), then starts a new session.
 async function init() {
-    await fetchModels();
-    newSession();
-    loadSessions();
+    try {
+        const res = await fetch(`${API_BASE}/bootstrap`);
+        const data = await res.json();
+        MODELS = data.models ?? [];
+        populateModels();
+        newSession();
+        sessionsList.innerHTML = '';
+        renderSessions(data.sessions ?? []);
+        sessionsCursor = data.next_after ?? null;
+    } catch(e) {
+        console.warn('Bootstrap failed, loading separately', e);
+        await fetchModels();
+        newSession();
+        loadSessions();
+    }
 }
 
 // Populate the model dropdown from the /models API endpoint
@@ -55,11 +76,16 @@ async function fetchModels() {
 function populateModels() {
     modelDropdown.querySelectorAll('.model-item').forEach(el => el.remove());
 
-    MODELS.forEach(m => {
+    MODELS.forEach(model => {
+        // /models returns catalog entries; older servers returned plain ids
+        const m = model.id ?? model;
         const item = document.createElement('a');
         item.className = 'model-item';
         if (m === currentModel) item.classList.add('active');
         item.textContent = m;
+        if (model.context_length) {
+            item.title = `${model.context_length.toLocaleString()} token context`;
+        }
         item.addEventListener('click', (e) => {
             e.preventDefault();
             currentModel = m;
@@ -93,8 +119,10 @@ function generateUUID() {
 
 // Create a brand-new chat session and open a WebSocket for it
 function newSession() {
+    cancelReply();
     if (ws) { ws.close(); ws = null; }
     sessionId = generateUUID();
+    lastSeq = 0;   // nothing published yet, so every frame is new to us
     currentModel = currentModel || 'openai/gpt-4.1-mini';
     clearMessages();
     sessionTitle.childNodes[0].textContent = 'New Chat';
@@ -102,20 +130,26 @@ function newSession() {
     connectWebSocket();
 }
 
-// Restore a previous session: fetch its history, update UI, reconnect WS
+// Restore a previous session: reconnect WS and, in parallel, fetch the session
+// row and its latest history in one request
 async function loadSession(id) {
+    cancelReply();
     if (ws) { ws.close(); ws = null; }
     sessionId = id;
+    lastSeq = null;   // earlier frames are already in the /full history
     clearMessages();
+    connectWebSocket();
+    highlightSession(id);
 
     try {
-        const res = await fetch(`${API_BASE}/history/${id}`);
+        const res = await fetch(`${API_BASE}/session/${id}/full`);
         const data = await res.json();
+        if (id !== sessionId) return;
         const msgs = data.messages ?? [];
         msgs.forEach(m => appendMessage(m.role, m.content));
+        historyCursor = data.next_before ?? null;
 
-        const sRes = await fetch(`${API_BASE}/session/${id}`);
-        const sData = await sRes.json();
+        const sData = data.session ?? {};
         if (sData.model) {
             currentModel = sData.model;
             modelDropBtn.textContent = currentModel.split('/')[1] ?? currentModel;
@@ -126,25 +160,63 @@ async function loadSession(id) {
     } catch(e) {
         showToast('Failed to load session');
     }
+}
 
-    connectWebSocket();
-    highlightSession(id);
+// Fetch the next older page of history and prepend it, keeping the scroll
+// position so the messages the user was reading stay in place.
+async function loadOlderMessages() {
+    if (historyCursor === null || loadingOlder) return;
+    loadingOlder = true;
+    const id = sessionId;
+    try {
+        const res = await fetch(`${API_BASE}/history/${id}?before=${historyCursor}`);
+        const data = await res.json();
+        if (id !== sessionId) return;
+        const prevHeight = chatBox.scrollHeight;
+        const firstRow = chatBox.querySelector('.msg-row');
+        (data.messages ?? []).forEach(m => {
+            chatBox.insertBefore(buildMessageRow(m.role, m.content), firstRow);
+        });
+        chatBox.scrollTop += chatBox.scrollHeight - prevHeight;
+        historyCursor = data.next_before ?? null;
+    } catch(e) {
+        showToast('Failed to load older messages');
+    } finally {
+        loadingOlder = false;
+    }
 }
 
-// Fetch all sessions from the API and render them in the sidebar
+// Reload the sidebar from the first page; later pages load as it scrolls
 async function loadSessions() {
     try {
         const res = await fetch(`${API_BASE}/sessions`);
         const data = await res.json();
+        sessionsList.innerHTML = '';
         renderSessions(data.sessions ?? []);
+        sessionsCursor = data.next_after ?? null;
     } catch(e) {
         console.warn('Could not load sessions', e);
     }
 }
 
-// Build the sidebar session list DOM from an array of session objects
+// Fetch the next page of sessions and append it to the sidebar
+async function loadMoreSessions() {
+    if (sessionsCursor === null || loadingSessions) return;
+    loadingSessions = true;
+    try {
+        const res = await fetch(`${API_BASE}/sessions?after=${encodeURIComponent(sessionsCursor)}`);
+        const data = await res.json();
+        renderSessions(data.sessions ?? []);
+        sessionsCursor = data.next_after ?? null;
+    } catch(e) {
+        console.warn('Could not load more sessions', e);
+    } finally {
+        loadingSessions = false;
+    }
+}
+
+// Append sidebar items for an array of session objects
 function renderSessions(sessions) {
-    sessionsList.innerHTML = '';
     sessions.forEach(s => {
         const item = document.createElement('div');
         item.className = 'session-item';
@@ -187,21 +259,39 @@ async function deleteSession(id) {
 
 // ── WebSocket ────────────────────────────────────────────────────────────────
 // Opens a WS connection for the current session to receive streamed responses.
-function connectWebSocket() {
+// On reconnect it passes the last seq it saw so the server replays missed
+// frames (or asks for a resync). A restored session that hasn't received a
+// numbered frame yet has no position to resume from, so it resyncs itself.
+function connectWebSocket(reconnect = false) {
     setWsStatus('connecting');
-    ws = new WebSocket(`${WS_BASE}/ws/${sessionId}`);
+    const resume = reconnect && lastSeq !== null ? `?last_seq=${lastSeq}` : '';
+    const socket = new WebSocket(`${WS_BASE}/ws/${sessionId}${resume}`);
+    ws = socket;
 
-    ws.onopen = () => {
+    socket.onopen = () => {
         setWsStatus('connected');
+        if (!isWaiting) sendButton.disabled = false;
+        resetWatchdog(socket);
+        if (reconnect && lastSeq === null) resyncHistory();
     };
 
-    ws.onmessage = (event) => {
+    socket.onmessage = (event) => {
         const data = JSON.parse(event.data);
-
-        if (data.type === 'message') {
+        resetWatchdog(socket);
+        if (data.seq !== undefined) lastSeq = Math.max(lastSeq ?? 0, data.seq);
+
+        if (data.type === 'ping') {
+            socket.send(JSON.stringify({ type: 'pong' }));
+        } else if (data.type === 'resync') {
+            resyncHistory();
+        } else if (data.type === 'delta') {
+            appendDelta(data.content);
+        } else if (data.type === 'message') {
             removeTypingIndicator();
+            finishStream();
             appendMessage(data.role, data.content);
             isWaiting = false;
+            pendingMsgId = null;
             sendButton.disabled = false;
 
             // Server may send an auto-generated title after the first reply
@@ -209,26 +299,70 @@ function connectWebSocket() {
                 sessionTitle.childNodes[0].textContent = data.title;
                 loadSessions();
             }
+        } else if (data.type === 'cancelled') {
+            removeTypingIndicator();
+            finishStream();
+            if (data.content) appendMessage('assistant', data.content);
+            isWaiting = false;
+            pendingMsgId = null;
+            sendButton.disabled = false;
         } else if (data.type === 'error') {
             removeTypingIndicator();
+            finishStream();
             showToast(data.message || 'Something went wrong');
             isWaiting = false;
+            pendingMsgId = null;
             sendButton.disabled = false;
-        } else if (data.type === 'title_update') {
+        } else if (data.type === 'title' || data.type === 'title_update') {
             sessionTitle.childNodes[0].textContent = data.title;
             loadSessions();
         }
     };
 
-    ws.onerror = () => setWsStatus('disconnected');
+    socket.onerror = () => setWsStatus('disconnected');
 
-    ws.onclose = () => {
+    socket.onclose = () => {
+        // Ignore sockets we replaced when switching sessions
+        if (ws !== socket) return;
+        clearTimeout(wsWatchdog);
         setWsStatus('disconnected');
         sendButton.disabled = true;
-        if (sessionId) setTimeout(connectWebSocket, 2000);
+        if (sessionId) setTimeout(() => connectWebSocket(true), 2000);
     };
 }
 
+// The server pings every 20s; if nothing arrives for much longer than that
+// the connection is dead even if the browser hasn't noticed, so reconnect.
+function resetWatchdog(socket) {
+    clearTimeout(wsWatchdog);
+    wsWatchdog = setTimeout(() => socket.close(), 45000);
+}
+
+// The server no longer has the frames we missed: reload the visible history
+async function resyncHistory() {
+    const id = sessionId;
+    try {
+        const res = await fetch(`${API_BASE}/session/${id}/full`);
+        const data = await res.json();
+        if (id !== sessionId) return;
+        const msgs = data.messages ?? [];
+        clearMessages();
+        msgs.forEach(m => appendMessage(m.role, m.content));
+        historyCursor = data.next_before ?? null;
+
+        const last = msgs[msgs.length - 1];
+        if (last && last.role.toLowerCase() === 'user' && (last.state === 'Pending' || last.state === 'Processing')) {
+            showTypingIndicator();
+        } else {
+            isWaiting = false;
+            pendingMsgId = null;
+            sendButton.disabled = false;
+        }
+    } catch(e) {
+        showToast('Failed to refresh history');
+    }
+}
+
 // Update the coloured dot in the header to reflect WS state
 function setWsStatus(state) {
     wsStatus.className = `ws-status ${state}`;
@@ -259,7 +393,9 @@ async function sendMessage() {
             })
         });
         const data = await res.json();
-        if (data.status !== 'ok') {
+        if (data.status === 'ok') {
+            pendingMsgId = data.msg_id;
+        } else {
             removeTypingIndicator();
             showToast(data.message || 'Failed to send message');
             isWaiting = false;
@@ -273,11 +409,30 @@ async function sendMessage() {
     }
 }
 
+// Stop the reply we're waiting for, if any; whatever was generated is kept
+function cancelReply() {
+    if (!isWaiting || pendingMsgId === null) return;
+    if (ws && ws.readyState === WebSocket.OPEN) {
+        ws.send(JSON.stringify({ type: 'cancel', msg_id: pendingMsgId }));
+    } else {
+        fetch(`${API_BASE}/message/${pendingMsgId}/cancel?session_id=${sessionId}`, { method: 'POST' }).catch(() => {});
+    }
+    pendingMsgId = null;
+    isWaiting = false;
+    sendButton.disabled = false;
+}
+
 // Append a user or assistant message row to the chat box.
 // Assistant content is rendered as markdown via marked.js.
 function appendMessage(role, content) {
     if (emptyState) emptyState.style.display = 'none';
 
+    chatBox.appendChild(buildMessageRow(role, content));
+    chatBox.scrollTop = chatBox.scrollHeight;
+}
+
+// Build (but don't insert) the DOM row for one message
+function buildMessageRow(role, content) {
     const row = document.createElement('div');
     row.className = `msg-row ${role}`;
 
@@ -299,8 +454,7 @@ function appendMessage(role, content) {
 
     row.appendChild(icon);
     row.appendChild(body);
-    chatBox.appendChild(row);
-    chatBox.scrollTop = chatBox.scrollHeight;
+    return row;
 }
 
 // Show three bouncing dots while waiting for the assistant reply
@@ -323,6 +477,30 @@ function showTypingIndicator() {
     chatBox.scrollTop = chatBox.scrollHeight;
 }
 
+// Append a streamed token to the in-progress assistant row, creating it on the
+// first delta. The final 'message' frame replaces it with the complete reply.
+function appendDelta(text) {
+    let body = document.querySelector('#streamRow .msg-body');
+    if (!body) {
+        removeTypingIndicator();
+        appendMessage('assistant', '');
+        const row = chatBox.lastElementChild;
+        row.id = 'streamRow';
+        body = row.querySelector('.msg-body');
+        streamText = '';
+    }
+    streamText += text;
+    body.innerHTML = marked.parse(streamText);
+    chatBox.scrollTop = chatBox.scrollHeight;
+}
+
+// Drop the in-progress streamed row (if any) and reset the buffer
+function finishStream() {
+    const el = document.getElementById('streamRow');
+    if (el) el.remove();
+    streamText = '';
+}
+
 function removeTypingIndicator() {
     const el = document.getElementById('typingRow');
     if (el) el.remove();
@@ -330,6 +508,8 @@ function removeTypingIndicator() {
 
 // Reset the chat box to its initial empty state
 function clearMessages() {
+    streamText = '';
+    historyCursor = null;
     chatBox.innerHTML = '';
     chatBox.appendChild(emptyState);
     emptyState.style.display = '';
@@ -359,9 +539,21 @@ async function changeModel() {
 
 sendButton.addEventListener('click', sendMessage);
 
+// Lazily load older history when the user scrolls to the top
+chatBox.addEventListener('scroll', () => {
+    if (chatBox.scrollTop < 50) loadOlderMessages();
+});
+
+// Fetch the next page of sessions as the sidebar nears its bottom
+sessionsList.addEventListener('scroll', () => {
+    if (sessionsList.scrollHeight - sessionsList.scrollTop - sessionsList.clientHeight < 100) loadMoreSessions();
+});
+
 userInput.addEventListener('keydown', (event) => {
     if (event.key === 'Enter') {
         sendMessage();
+    } else if (event.key === 'Escape') {
+        cancelReply();
     }
 });
 
@@ -1,76 +1,282 @@
 import os
-import requests
-import json
-from dotenv import load_dotenv
-load_dotenv()
-import uuid
-def get_response(message):
-  OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-  response = requests.post(
-    url="https://openrouter.ai/api/v1/chat/completions",
-    headers={
-      "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-      "Content-Type": "application/json",
-    },
-    json={
-      "model": "openai/gpt-4.1-mini",
-      "messages" : message,
-    }
-  )
-
-  response_json = response.json()
-  if "choices" not in response_json:
-    print("API ERROR:", response_json)
-    return "ERROR"
-  res = (response.json()["choices"][0]["message"]["content"])
-
-  return res
-
+import time
+import asyncio
+from collections import deque
+from openrouter_client import chat_completion, stream_chat_completion
+from completion_cache import completion_cache, cache_key
 
 
-def new_chat(message:str):
+async def new_chat(message:str, model_name:str = "openai/gpt-4.1-mini"):
   prompt = "THis is a API call from a chat based AI app. I need you to look at the user's message and make a chat name and return ONLY the title of the chat. Dont return ANYTHING ELSE. Your job is to think of what the chat's topic is about and make a name for it. Example: if someone asks you a Calculus problem, dont put the problem as the chat name. You should say the chat name is something like: Calculus solving, Calculus Question. ALso avoid generalized names like General chat or general discussion. The aim is to have a chat title where the viewer knows what chat it was just by looking at the title."
-  OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 
   messages = [
     {"role": "system", "content": prompt},
 
     {"role": "user", "content": message},
   ]
-  response = requests.post(
-    url="https://openrouter.ai/api/v1/chat/completions",
-    headers={
-      "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-      "Content-Type": "application/json",
-    },
-    json={
-      "model": "openai/gpt-4.1-mini",
-      "messages": messages,
-    }
-  )
+  key = cache_key(model_name, messages) if completion_cache else None
+  if key and (cached := await completion_cache.get(key)) is not None:
+    return cached
+
+  start = time.perf_counter()
+  response_json = await chat_completion({
+    "model": model_name,
+    "messages": messages,
+  })
 
-  res = (response.json()["choices"][0]["message"]["content"])
+  if "choices" not in response_json:
+    print("API ERROR:", response_json)
+    return None
+  res = (response_json["choices"][0]["message"]["content"])
+  if key:
+    await completion_cache.set(key, res, time.perf_counter() - start)
   return res
 
 
-def model_chat(message , model_name:str):
-  OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-  response = requests.post(
-    url="https://openrouter.ai/api/v1/chat/completions",
-    headers={
-      "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-      "Content-Type": "application/json",
-    },
-    json={
-      "model": f"{model_name}",
-      "messages": message,
-    }
-  )
+async def model_chat_stream(message, model_name:str, use_cache:bool = True):
+  """Yield the assistant reply piece by piece as the model generates it."""
+  key = cache_key(model_name, message) if completion_cache and use_cache else None
+  if key and (cached := await completion_cache.get(key)) is not None:
+    yield cached
+    return
+
+  start = time.perf_counter()
+  parts = []
+  async for delta in stream_chat_completion({
+    "model": f"{model_name}",
+    "messages": message,
+  }):
+    parts.append(delta)
+    yield delta
+
+  if key and parts:
+    await completion_cache.set(key, "".join(parts), time.perf_counter() - start)
+
+
+async def summarize_chat(previous_summary:str, messages):
+  """Fold `messages` into the running summary of a conversation's older turns."""
+  prompt = "You maintain a running summary of an earlier part of a conversation between a user and an AI assistant. Update the summary with the new messages. Keep the facts, decisions, names, code identifiers and open questions the assistant would need to continue the conversation. Return ONLY the summary, at most 250 words."
+  transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+
+  response_json = await chat_completion({
+    "model": os.getenv("SUMMARY_MODEL", "openai/gpt-4.1-mini"),
+    "messages": [
+      {"role": "system", "content": prompt},
+      {"role": "user", "content": f"Current summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"},
+    ],
+  })
 
-  response_json = response.json()
   if "choices" not in response_json:
     print("API ERROR:", response_json)
-    return "ERROR"
-  res = (response.json()["choices"][0]["message"]["content"])
+    return None
+  return response_json["choices"][0]["message"]["content"]
+
+
+
+# ── Routing: fallback chains, deadlines and hedged requests ─────────────────
+# route_chat_stream tries a chain of models for one reply. If the current
+# model fails before producing a token, the next one is tried. If it is slow
+# to produce its first token (past its recent p95), a second request is
+# fired at the next model and whichever answers first wins; the other is
+# cancelled. Per-model latency/error stats drive the hedge threshold.
+# REQUEST_DEADLINE bounds the wait for the first token; once a model is
+# streaming, only OPENROUTER_READ_TIMEOUT (reset by every chunk) applies, so
+# long replies are not cut off.
+
+FALLBACK_MODELS = [m.strip() for m in os.getenv("FALLBACK_MODELS", "").split(",") if m.strip()]
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "120"))
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "0") == "1"
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "4"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.5"))
+HEDGE_MAX_DELAY = float(os.getenv("HEDGE_MAX_DELAY", "15"))
+HEDGE_MIN_SAMPLES = 20
+
+
+class ModelUnavailable(Exception):
+  pass
+
+
+class LatencyTracker:
+  """Per-model histograms of time-to-first-token and total time, plus error counts."""
+  BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, float("inf"))
+
+  def __init__(self):
+    self.models = {}
+
+  def _model(self, model_name:str):
+    if model_name not in self.models:
+      self.models[model_name] = {
+        "ttft": [0] * len(self.BUCKETS),
+        "total": [0] * len(self.BUCKETS),
+        "recent_ttft": deque(maxlen=200),
+        "requests": 0,
+        "errors": 0,
+        "hedges_won": 0,
+      }
+    return self.models[model_name]
+
+  def _observe(self, buckets:list, seconds:float):
+    for i, bound in enumerate(self.BUCKETS):
+      if seconds <= bound:
+        buckets[i] += 1
+        return
+
+  def record_first_token(self, model_name:str, seconds:float):
+    m = self._model(model_name)
+    self._observe(m["ttft"], seconds)
+    m["recent_ttft"].append(seconds)
+
+  def record_done(self, model_name:str, seconds:float):
+    m = self._model(model_name)
+    m["requests"] += 1
+    self._observe(m["total"], seconds)
+
+  def record_error(self, model_name:str):
+    m = self._model(model_name)
+    m["requests"] += 1
+    m["errors"] += 1
+
+  def record_hedge_win(self, model_name:str):
+    self._model(model_name)["hedges_won"] += 1
+
+  def ttft_p95(self, model_name:str):
+    samples = sorted(self._model(model_name)["recent_ttft"])
+    if len(samples) < HEDGE_MIN_SAMPLES:
+      return None
+    return samples[int(0.95 * (len(samples) - 1))]
+
+  def hedge_delay(self, model_name:str) -> float:
+    p95 = self.ttft_p95(model_name)
+    if p95 is None:
+      return HEDGE_DEFAULT_DELAY
+    return min(HEDGE_MAX_DELAY, max(HEDGE_MIN_DELAY, p95))
+
+  def stats(self) -> dict:
+    labels = [str(b) for b in self.BUCKETS[:-1]] + ["+Inf"]
+    return {
+      name: {
+        "requests": m["requests"],
+        "errors": m["errors"],
+        "error_rate": round(m["errors"] / m["requests"], 4) if m["requests"] else 0.0,
+        "hedges_won": m["hedges_won"],
+        "ttft_p95": self.ttft_p95(name),
+        "ttft_histogram": dict(zip(labels, m["ttft"])),
+        "total_histogram": dict(zip(labels, m["total"])),
+      }
+      for name, m in self.models.items()
+    }
+
+
+latency_tracker = LatencyTracker()
+
+
+async def _pump(model_name:str, message, use_cache:bool, events:asyncio.Queue):
+  """Run one model's stream, reporting ("delta"|"done"|"error", model, value) events."""
+  try:
+    async for delta in model_chat_stream(message, model_name, use_cache):
+      await events.put(("delta", model_name, delta))
+    await events.put(("done", model_name, None))
+  except asyncio.CancelledError:
+    raise
+  except Exception as e:
+    await events.put(("error", model_name, e))
+
+
+async def route_chat_stream(message, models:list, deadline:float = REQUEST_DEADLINE, hedge:bool = HEDGE_ENABLED, use_cache:bool = True):
+  """Yield reply deltas from the first model in `models` to start answering within `deadline`."""
+  loop = asyncio.get_running_loop()
+  start = loop.time()
+  give_up_at = start + deadline
+  events = asyncio.Queue()
+  running = {}
+  started_at = {}
+  next_index = 0
+  winner = None
+  last_error = None
+
+  def launch():
+    nonlocal next_index
+    model_name = models[next_index]
+    next_index += 1
+    started_at[model_name] = loop.time()
+    running[model_name] = asyncio.create_task(_pump(model_name, message, use_cache, events))
+    return model_name
+
+  primary = launch()
+  hedge_at = start + latency_tracker.hedge_delay(primary) if hedge and next_index < len(models) else None
+
+  try:
+    while True:
+      timers = [t for t in (give_up_at, hedge_at) if t is not None]
+      timeout = max(0, min(timers) - loop.time()) if timers else None
+      try:
+        kind, model_name, value = await asyncio.wait_for(events.get(), timeout)
+      except asyncio.TimeoutError:
+        if give_up_at is not None and loop.time() >= give_up_at:
+          raise ModelUnavailable(f"No reply from {', '.join(running)} within {deadline:g}s")
+        # Hedge: the current model is slow to start, race the next one against it
+        hedge_at = None
+        if winner is None and next_index < len(models):
+          print(f"Hedging {', '.join(running)} with {models[next_index]}")
+          launch()
+        continue
+
+      if model_name != winner and winner is not None:
+        continue  # leftovers from a cancelled loser
+
+      if kind == "delta":
+        if winner is None:
+          winner = model_name
+          hedge_at = None
+          give_up_at = None
+          latency_tracker.record_first_token(model_name, loop.time() - started_at[model_name])
+          if model_name != primary:
+            latency_tracker.record_hedge_win(model_name)
+          for other, task in running.items():
+            if other != model_name:
+              task.cancel()
+        yield value
+
+      elif kind == "done":
+        running.pop(model_name, None)
+        if winner == model_name:
+          latency_tracker.record_done(model_name, loop.time() - started_at[model_name])
+          return
+        last_error = ModelUnavailable(f"{model_name} returned an empty reply")
+        latency_tracker.record_error(model_name)
+
+      elif kind == "error":
+        running.pop(model_name, None)
+        latency_tracker.record_error(model_name)
+        print(f"Model {model_name} failed: {value}")
+        if winner == model_name:
+          raise ModelUnavailable(f"{model_name} failed mid-reply: {value}")
+        last_error = value
+
+      if winner is None and not running:
+        if next_index >= len(models):
+          raise ModelUnavailable(f"All models failed, last error: {last_error}")
+        fallback = launch()
+        print(f"Falling back to {fallback}")
+        if hedge and next_index < len(models):
+          hedge_at = loop.time() + latency_tracker.hedge_delay(fallback)
+  finally:
+    for task in running.values():
+      task.cancel()
+
+
+async def route_chat(message, models:list, deadline:float = REQUEST_DEADLINE, hedge:bool = HEDGE_ENABLED, use_cache:bool = True):
+  """Buffered form of route_chat_stream: the whole reply as one string."""
+  parts = []
+  async for delta in route_chat_stream(message, models, deadline, hedge, use_cache):
+    parts.append(delta)
+  return "".join(parts)
+
 
-  return res
\ No newline at end of file
+def model_chain(model_name:str, fallbacks:list = None) -> list:
+  """The session's model followed by its fallbacks (or FALLBACK_MODELS), without repeats."""
+  chain = [model_name]
+  for m in (fallbacks if fallbacks is not None else FALLBACK_MODELS):
+    if m and m not in chain:
+      chain.append(m)
+  return chain
\ No newline at end of file
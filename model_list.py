@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 models = """writer/palmyra-x5
 liquid/lfm-2.5-1.2b-thinking:free
 liquid/lfm-2.5-1.2b-instruct:free
@@ -346,15 +348,44 @@ openai/gpt-3.5-turbo
 """
 models = [m.strip() for m in models.splitlines() if m.strip()]
 
-final_models = models
-free_models=[]
-for model in final_models:
-    if "free" in model:
+# Build both lists in one pass; removing from the list being iterated used to
+# skip the element after each removal and leave some :free models behind.
+free_models = sorted(m for m in models if m.endswith(":free"))
+final_models = sorted(m for m in models if not m.endswith(":free"))
 
-        free_models.append(model)
-        final_models.remove(model)
+# Approximate context windows (tokens), matched by longest model-name prefix.
+# Used to size the chat history sent with each request. A prefix also covers
+# every newer model that extends the name ("openai/gpt-4" would match
+# gpt-4o), so give those families their own entry.
+DEFAULT_CONTEXT_LENGTH = 8192
+context_lengths = {
+    "openai/gpt-4.1": 1047576,
+    "openai/gpt-5": 400000,
+    "openai/gpt-4o": 128000,
+    "openai/chatgpt-4o-latest": 128000,
+    "openai/gpt-4o:extended": 64000,
+    "openai/gpt-4-turbo": 128000,
+    "openai/gpt-4-1106-preview": 128000,
+    "openai/gpt-4": 8191,
+    "openai/gpt-3.5-turbo-instruct": 4095,
+    "openai/gpt-3.5-turbo": 16385,
+    "google/gemini-3": 1048576,
+    "deepseek/": 163840,
+    "mistralai/mistral-7b-instruct": 32768,
+    "mistralai/mixtral-8x7b": 32768,
+    "mistralai/": 131072,
+    "z-ai/": 131072,
+    "gryphe/mythomax-l2-13b": 4096,
+    "undi95/remm-slerp-l2-13b": 6144,
+    "alpindale/goliath-120b": 6144,
+    "neversleep/noromaid-20b": 4096,
+    "mancer/weaver": 8000,
+}
 
-final_models.sort()
-free_models.sort()
 
-print(final_models)
\ No newline at end of file
+@lru_cache(maxsize=4096)
+def context_length(model_name: str) -> int:
+    matches = [p for p in context_lengths if model_name.startswith(p)]
+    if not matches:
+        return DEFAULT_CONTEXT_LENGTH
+    return context_lengths[max(matches, key=len)]
@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+
+from model_list import final_models, context_length as estimated_context_length
+
+# ── Model registry ───────────────────────────────────────────────────────────
+# Catalog of available models with their context length, pricing and
+# modality, loaded from OpenRouter's /models endpoint and cached on disk. It is
+# refreshed in the background (conditional on the ETag) once it is older than
+# MODEL_CATALOG_TTL. With MODEL_CATALOG_OFFLINE=1, or before the first
+# successful fetch, the hand-maintained list in model_list.py is used.
+
+MODEL_CATALOG_OFFLINE = os.getenv("MODEL_CATALOG_OFFLINE", "0") == "1"
+MODEL_CATALOG_TTL = float(os.getenv("MODEL_CATALOG_TTL", "3600"))
+MODEL_CATALOG_PATH = os.getenv("MODEL_CATALOG_PATH", ".cache/models.json")
+
+
+def _parse_model(raw: dict) -> dict:
+    pricing = raw.get("pricing") or {}
+    architecture = raw.get("architecture") or {}
+    return {
+        "id": raw["id"],
+        "name": raw.get("name", raw["id"]),
+        "context_length": raw.get("context_length"),
+        "pricing": {
+            "prompt": pricing.get("prompt"),
+            "completion": pricing.get("completion"),
+        },
+        "modality": architecture.get("modality"),
+    }
+
+
+def _fallback_model(model_id: str) -> dict:
+    return {
+        "id": model_id,
+        "name": model_id,
+        "context_length": estimated_context_length(model_id),
+        "pricing": {"prompt": None, "completion": None},
+        "modality": None,
+    }
+
+
+class ModelRegistry:
+    def __init__(self, path: str = MODEL_CATALOG_PATH, ttl: float = MODEL_CATALOG_TTL, offline: bool = MODEL_CATALOG_OFFLINE):
+        self.path = path
+        self.ttl = ttl
+        self.offline = offline
+        self.models: dict[str, dict] = {}
+        self.source = "fallback"
+        self.upstream_etag: str | None = None
+        self.fetched_at = 0.0
+        self.etag = ""
+        self._refresher: asyncio.Task | None = None
+        self._use_fallback()
+
+    # ── loading ──────────────────────────────────────────────────────────────
+
+    def _use_fallback(self):
+        self._set_models([_fallback_model(m) for m in final_models], "fallback")
+
+    def _set_models(self, models: list[dict], source: str):
+        self.models = {m["id"]: m for m in sorted(models, key=lambda m: m["id"])}
+        self.source = source
+        self._listing = [m for m in self.models.values() if not m["id"].endswith(":free")]
+        # Serialised once per catalog change; GET /models sends these bytes as-is
+        self.listing_body = json.dumps({"models": self._listing, "source": source}, sort_keys=True).encode()
+        self.etag = f'"{hashlib.sha256(self.listing_body).hexdigest()[:32]}"'
+
+    def load_from_disk(self) -> bool:
+        if self.offline:
+            return False
+        try:
+            with open(self.path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return False
+        self.upstream_etag = cached.get("etag")
+        self.fetched_at = cached.get("fetched_at", 0.0)
+        self._set_models(cached["models"], "disk")
+        return True
+
+    def _save_to_disk(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump({
+                    "etag": self.upstream_etag,
+                    "fetched_at": self.fetched_at,
+                    "models": list(self.models.values()),
+                }, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Could not write model catalog cache: {e}")
+
+    async def refresh(self):
+        """Fetch the catalog from OpenRouter unless the cached copy is still current."""
+        from openrouter_client import fetch_models
+
+        if self.offline:
+            return
+        try:
+            response = await fetch_models(self.upstream_etag if self.source != "fallback" else None)
+            if response.status_code == 304:
+                self.fetched_at = time.time()
+                self._save_to_disk()
+                return
+            response.raise_for_status()
+            data = response.json()["data"]
+            self._set_models([_parse_model(m) for m in data], "openrouter")
+            self.upstream_etag = response.headers.get("etag")
+            self.fetched_at = time.time()
+            self._save_to_disk()
+            print(f"Model catalog refreshed: {len(self.models)} models")
+        except Exception as e:
+            print(f"Model catalog refresh failed: {e}")
+
+    @property
+    def stale(self) -> bool:
+        return time.time() - self.fetched_at > self.ttl
+
+    async def _refresh_loop(self):
+        while True:
+            if self.stale:
+                await self.refresh()
+            await asyncio.sleep(min(self.ttl, 300))
+
+    async def start(self):
+        self.load_from_disk()
+        if not self.offline and self._refresher is None:
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._refresher:
+            self._refresher.cancel()
+            await asyncio.gather(self._refresher, return_exceptions=True)
+            self._refresher = None
+
+    # ── lookups ──────────────────────────────────────────────────────────────
+
+    def listing(self) -> list[dict]:
+        """Models offered in the UI (free variants excluded, as before)."""
+        return self._listing
+
+    def get(self, model_id: str) -> dict | None:
+        return self.models.get(model_id)
+
+    def context_length(self, model_id: str) -> int:
+        model = self.models.get(model_id)
+        if model and model.get("context_length"):
+            return model["context_length"]
+        return estimated_context_length(model_id)
+
+
+registry = ModelRegistry()
@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import random
+import asyncio
+import httpx
+from email.utils import parsedate_to_datetime
+
+from ratelimit import KeyedLimiter
+
+# ── Shared OpenRouter HTTP client ────────────────────────────────────────────
+# One keep-alive connection pool for the whole process so completions reuse
+# TCP/TLS connections instead of paying a fresh handshake per call.
+
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+POOL_SIZE = int(os.getenv("OPENROUTER_POOL_SIZE", "100"))
+KEEPALIVE_CONNECTIONS = int(os.getenv("OPENROUTER_KEEPALIVE", "20"))
+CONNECT_TIMEOUT = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.getenv("OPENROUTER_READ_TIMEOUT", "120"))
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Retries: exponential backoff with full jitter, honouring Retry-After.
+RETRY_MAX_ATTEMPTS = int(os.getenv("OPENROUTER_RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("OPENROUTER_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("OPENROUTER_RETRY_MAX_DELAY", "20"))
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# Client-side token buckets (requests/second and burst) per API key and per
+# model, so bursts wait for capacity here instead of being rejected upstream.
+# Rates are off (0) by default: a fixed cap per process sits far below what
+# the upstream allows. Either way a 429 or exhausted quota pauses the key's
+# (and the model's) bucket for the Retry-After the upstream asked for.
+KEY_RATE_LIMIT = float(os.getenv("OPENROUTER_KEY_RATE", "0"))
+KEY_BURST = float(os.getenv("OPENROUTER_KEY_BURST", "40"))
+MODEL_RATE_LIMIT = float(os.getenv("OPENROUTER_MODEL_RATE", "0"))
+MODEL_BURST = float(os.getenv("OPENROUTER_MODEL_BURST", "20"))
+
+key_limiter = KeyedLimiter(KEY_RATE_LIMIT, KEY_BURST)
+model_limiter = KeyedLimiter(MODEL_RATE_LIMIT, MODEL_BURST)
+
+_client: httpx.AsyncClient | None = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the process-wide AsyncClient, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=OPENROUTER_BASE_URL,
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=POOL_SIZE,
+                max_keepalive_connections=KEEPALIVE_CONNECTIONS,
+            ),
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _headers() -> dict:
+    return {
+        "Authorization": f"Bearer {os.getenv('OPENROUTER_API_KEY')}",
+        "Content-Type": "application/json",
+    }
+
+
+def _retry_after(response: httpx.Response) -> float | None:
+    """Seconds the server asked us to wait, from Retry-After or X-RateLimit-Reset."""
+    value = response.headers.get("retry-after")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    reset = response.headers.get("x-ratelimit-reset")
+    if reset and response.headers.get("x-ratelimit-remaining") == "0":
+        try:
+            # OpenRouter reports the reset time in epoch milliseconds
+            return max(0.0, float(reset) / 1000 - time.time())
+        except ValueError:
+            pass
+    return None
+
+
+def _backoff(attempt: int) -> float:
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+async def _throttle(model_name: str):
+    await key_limiter.acquire(os.getenv("OPENROUTER_API_KEY") or "")
+    await model_limiter.acquire(model_name or "")
+
+
+def _note_rate_limit(response: httpx.Response, model_name: str) -> float | None:
+    """Pause our buckets when the upstream says we are out of quota."""
+    wait = _retry_after(response)
+    if wait is not None and (response.status_code == 429 or response.headers.get("x-ratelimit-remaining") == "0"):
+        key_limiter.bucket(os.getenv("OPENROUTER_API_KEY") or "").block_for(wait)
+        if response.status_code == 429:
+            model_limiter.bucket(model_name or "").block_for(wait)
+    return wait
+
+
+async def _send_with_retries(send, model_name: str):
+    """
+    Call `send()` (which returns an httpx.Response) under the rate limiters,
+    retrying transport errors and retryable statuses. Returns the last response.
+    """
+    for attempt in range(RETRY_MAX_ATTEMPTS):
+        await _throttle(model_name)
+        last_attempt = attempt == RETRY_MAX_ATTEMPTS - 1
+        try:
+            response = await send()
+        except (httpx.TransportError, httpx.TimeoutException) as e:
+            if last_attempt:
+                raise
+            delay = _backoff(attempt)
+            print(f"OpenRouter request failed ({e!r}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
+
+        wait = _note_rate_limit(response, model_name)
+        if response.status_code not in RETRYABLE_STATUS or last_attempt:
+            return response
+        delay = wait if wait is not None else _backoff(attempt)
+        print(f"OpenRouter returned {response.status_code}, retrying in {delay:.1f}s")
+        await response.aclose()
+        await asyncio.sleep(min(delay, RETRY_MAX_DELAY))
+
+
+async def chat_completion(payload: dict) -> dict:
+    """POST /chat/completions and return the decoded JSON body."""
+    response = await _send_with_retries(
+        lambda: get_client().post("/chat/completions", headers=_headers(), json=payload),
+        payload.get("model"),
+    )
+    return response.json()
+
+
+async def stream_chat_completion(payload: dict):
+    """
+    POST /chat/completions with `stream: true` and yield each content delta
+    as it arrives. OpenRouter sends Server-Sent Events: `data: {json}` lines,
+    `: comment` keep-alives, and a final `data: [DONE]`.
+    """
+    client = get_client()
+    request = client.build_request(
+        "POST", "/chat/completions", headers=_headers(), json={**payload, "stream": True}
+    )
+    # Retries only happen before the first byte; once tokens flow, a failure
+    # is reported to the caller.
+    response = await _send_with_retries(lambda: client.send(request, stream=True), payload.get("model"))
+    try:
+        if response.status_code != 200:
+            body = await response.aread()
+            raise RuntimeError(f"OpenRouter returned {response.status_code}: {body[:200]!r}")
+
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            if "error" in chunk:
+                raise RuntimeError(f"OpenRouter stream error: {chunk['error']}")
+            choices = chunk.get("choices") or []
+            if not choices:
+                continue
+            delta = choices[0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+    finally:
+        await response.aclose()
+
+
+async def fetch_key_info() -> httpx.Response:
+    """GET /key: a few bytes about the API key, the cheapest authenticated call."""
+    return await get_client().get("/key", headers=_headers())
+
+
+async def fetch_models(etag: str = None) -> httpx.Response:
+    """GET /models, conditional on `etag` (a 304 means the catalog is unchanged)."""
+    headers = _headers()
+    if etag:
+        headers["If-None-Match"] = etag
+    return await get_client().get("/models", headers=headers)
@@ -0,0 +1,82 @@
+import time
+import asyncio
+from collections import OrderedDict
+
+# ── Client-side rate limiting ────────────────────────────────────────────────
+# Token buckets that make callers wait briefly for capacity instead of sending
+# requests that would be rejected upstream.
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        """`rate` tokens per second, holding at most `burst` tokens. A rate <= 0
+        is unlimited, apart from pauses set with block_for()."""
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, tokens: float = 1) -> float:
+        """Seconds until `tokens` are available (0 if they are now), without taking them."""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        if self.tokens >= tokens:
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """Take tokens if available and return 0, else return the seconds to wait."""
+        wait = self.wait_time(tokens)
+        if wait == 0 and self.rate > 0:
+            self.tokens -= tokens
+        return wait
+
+    async def acquire(self, tokens: float = 1):
+        if self.rate <= 0 and time.monotonic() >= self.blocked_until:
+            return
+        # The lock queues waiters in arrival order so a burst drains FIFO
+        async with self._lock:
+            while (wait := self.try_acquire(tokens)) > 0:
+                await asyncio.sleep(wait)
+
+    def block_for(self, seconds: float):
+        """Hold every caller back for `seconds`, e.g. after an upstream 429."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class KeyedLimiter:
+    """One TokenBucket per key (API key, model, session...), least recently used evicted."""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+
+    def bucket(self, key: str) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+            self._buckets[key] = bucket
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    async def acquire(self, key: str, tokens: float = 1):
+        await self.bucket(key).acquire(tokens)
+
+    def try_acquire(self, key: str, tokens: float = 1) -> float:
+        return self.bucket(key).try_acquire(tokens)
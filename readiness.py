@@ -0,0 +1,58 @@
+import os
+import time
+import asyncio
+
+# ── Readiness ────────────────────────────────────────────────────────────────
+# GET /ready runs one check per dependency, concurrently and each under
+# READY_TIMEOUT, and reports which of them failed and how long each took. The
+# instance is ready when every required check passes; optional ones (the model
+# provider) are reported but don't take it out of rotation, since every other
+# instance would be failing them too. Results are reused for READY_CACHE_TTL
+# seconds so a busy probe doesn't turn into load on the database.
+
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT", "3"))
+READY_CACHE_TTL = float(os.getenv("READY_CACHE_TTL", "2"))
+
+
+class Readiness:
+    def __init__(self, timeout: float = READY_TIMEOUT, cache_ttl: float = READY_CACHE_TTL):
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self._checks: dict[str, tuple] = {}
+        self._result: dict | None = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def add(self, name: str, check, required: bool = True):
+        """`check()` is a coroutine function that raises (or returns False) when unhealthy."""
+        self._checks[name] = (check, required)
+
+    async def _run_one(self, check) -> dict:
+        start = time.perf_counter()
+        try:
+            ok = await asyncio.wait_for(check(), self.timeout)
+            result = {"ok": ok is not False}
+        except asyncio.TimeoutError:
+            result = {"ok": False, "error": f"timed out after {self.timeout}s"}
+        except Exception as e:
+            result = {"ok": False, "error": str(e) or type(e).__name__}
+        result["ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    async def check(self) -> dict:
+        """Run every check (or reuse a recent result); returns the report served at /ready."""
+        async with self._lock:
+            if self._result is not None and time.monotonic() - self._checked_at < self.cache_ttl:
+                return self._result
+            names = list(self._checks)
+            results = await asyncio.gather(*(self._run_one(self._checks[n][0]) for n in names))
+            checks = {}
+            for name, result in zip(names, results):
+                result["required"] = self._checks[name][1]
+                checks[name] = result
+            self._result = {
+                "ready": all(c["ok"] for c in checks.values() if c["required"]),
+                "checks": checks,
+            }
+            self._checked_at = time.monotonic()
+            return self._result
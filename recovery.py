@@ -0,0 +1,77 @@
+import os
+import asyncio
+
+from scheduler import QueueFull
+
+# ── Recovery sweeper ─────────────────────────────────────────────────────────
+# Jobs live in process memory, so a message whose instance dies before
+# replying would stay Pending or Processing forever. At startup and then every
+# RECOVERY_INTERVAL seconds, this claims a batch of stuck messages and hands
+# them to the job scheduler. A message is leased as soon as it is queued and
+# the lease is kept up while it is answered, so only two kinds count as stuck:
+# Pending for longer than RECOVERY_AFTER (never queued anywhere, e.g. the
+# webhook was lost), and Processing under an expired lease (its instance
+# died). Claims are leases too, so several instances can sweep at once without
+# processing a message twice. RECOVERY_INTERVAL=0 disables it.
+
+RECOVERY_INTERVAL = float(os.getenv("RECOVERY_INTERVAL", "60"))
+RECOVERY_AFTER = float(os.getenv("RECOVERY_AFTER", "60"))
+RECOVERY_BATCH = int(os.getenv("RECOVERY_BATCH", "200"))
+
+
+class RecoverySweeper:
+    def __init__(self, scheduler, claim, interval: float = RECOVERY_INTERVAL,
+                 pending_after: float = RECOVERY_AFTER, batch: int = RECOVERY_BATCH):
+        """`claim(pending_seconds, limit)` returns the claimed message rows."""
+        self.scheduler = scheduler
+        self.claim = claim
+        self.interval = interval
+        self.pending_after = pending_after
+        self.batch = batch
+        self.recovered = 0
+        self.sweeps = 0
+        self._task: asyncio.Task | None = None
+
+    async def sweep(self) -> int:
+        """Re-enqueue one batch of stuck messages; returns how many were queued."""
+        # Don't claim more than the queue can take, or the extra rows would
+        # sit under our lease until it expires
+        room = min(self.batch, self.scheduler.max_queue - self.scheduler.depth)
+        if room <= 0:
+            return 0
+        rows = await self.claim(self.pending_after, room)
+        self.sweeps += 1
+
+        queued = 0
+        # Ids grow with insertion, so this keeps each session's messages in order
+        for row in sorted(rows, key=lambda r: r["id"]):
+            try:
+                if self.scheduler.submit(row["id"], row["session_id"]):
+                    queued += 1
+            except QueueFull:
+                break
+        if queued:
+            print(f"Recovered {queued} stuck message(s)")
+        self.recovered += queued
+        return queued
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"Recovery sweep failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"sweeps": self.sweeps, "recovered": self.recovered}
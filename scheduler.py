@@ -0,0 +1,263 @@
+import os
+import time
+import heapq
+import random
+import asyncio
+import itertools
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+# ── Job scheduler ────────────────────────────────────────────────────────────
+# Bounded asyncio queue drained by a fixed pool of workers. Jobs from the same
+# session run strictly one after another, every model has its own concurrency
+# cap, and a message id that is already queued or running is ignored so a
+# redelivered webhook doesn't queue it twice. Finished ids are forgotten: by
+# then the message's state (see claim_message) stops a second reply, and the
+# recovery sweeper must be able to queue it again if another instance that
+# claimed it dies. Workers take ready jobs in weighted
+# fair order across flows (a client, or the session when the client is
+# unknown), so one flow queueing many jobs can't starve the others.
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "16"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "1000"))
+JOB_MAX_RETRIES = int(os.getenv("JOB_MAX_RETRIES", "2"))
+JOB_MODEL_CONCURRENCY = int(os.getenv("JOB_MODEL_CONCURRENCY", "8"))
+# Per-model overrides, e.g. "openai/gpt-4.1-mini=32,openai/gpt-5.2-pro=2"
+JOB_MODEL_LIMITS = os.getenv("JOB_MODEL_LIMITS", "")
+JOB_DEDUPE_SIZE = int(os.getenv("JOB_DEDUPE_SIZE", "10000"))
+
+
+class QueueFull(Exception):
+    pass
+
+
+def parse_model_limits(spec: str) -> dict[str, int]:
+    limits = {}
+    for item in spec.split(","):
+        if "=" in item:
+            model, limit = item.rsplit("=", 1)
+            limits[model.strip()] = int(limit)
+    return limits
+
+
+class Job:
+    __slots__ = ("msg_id", "session_id", "flow", "weight", "enqueued_at", "attempts")
+
+    def __init__(self, msg_id, session_id, flow=None, weight: float = 1):
+        self.msg_id = msg_id
+        self.session_id = str(session_id)
+        self.flow = str(flow) if flow is not None else self.session_id
+        self.weight = weight
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+
+class FairQueue:
+    """
+    Start-time fair queuing: each job is tagged with a virtual start time,
+    the later of the current virtual time and the end of its flow's previous
+    job, and the smallest tag is served first. A flow with weight w gets w
+    times the share of a weight-1 flow while both have jobs waiting.
+    """
+
+    def __init__(self):
+        self._heap: list[tuple] = []
+        self._finish: dict[str, float] = {}   # flow -> virtual end of its last job
+        self._vtime = 0.0
+        self._order = itertools.count()
+        self._items = asyncio.Semaphore(0)
+
+    def qsize(self) -> int:
+        return len(self._heap)
+
+    def put_nowait(self, job: Job):
+        start = max(self._vtime, self._finish.get(job.flow, 0.0))
+        self._finish[job.flow] = start + 1 / job.weight
+        heapq.heappush(self._heap, (start, next(self._order), job))
+        self._items.release()
+
+    async def get(self) -> Job:
+        await self._items.acquire()
+        self._vtime, _, job = heapq.heappop(self._heap)
+        if len(self._finish) > 1000:
+            # Flows that are caught up would start at the virtual time anyway
+            self._finish = {f: t for f, t in self._finish.items() if t > self._vtime}
+        return job
+
+
+class JobScheduler:
+    def __init__(
+        self,
+        handler,
+        workers: int = JOB_WORKERS,
+        max_queue: int = JOB_QUEUE_SIZE,
+        max_retries: int = JOB_MAX_RETRIES,
+        model_concurrency: int = JOB_MODEL_CONCURRENCY,
+        model_limits: dict[str, int] = None,
+        dedupe_size: int = JOB_DEDUPE_SIZE,
+    ):
+        """`handler(msg_id, session_id)` is awaited once per job."""
+        self.handler = handler
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.model_concurrency = model_concurrency
+        self.model_limits = model_limits if model_limits is not None else parse_model_limits(JOB_MODEL_LIMITS)
+        self.dedupe_size = dedupe_size
+
+        self._queue = FairQueue()
+        self._session_waiting: dict[str, deque[Job]] = {}   # jobs behind a running one
+        self._busy_sessions: set[str] = set()
+        self._seen: OrderedDict = OrderedDict()
+        self._model_slots: dict[str, asyncio.Semaphore] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._requeues: set[asyncio.Task] = set()   # retries waiting out their backoff
+        self._waiting = 0
+        self._in_flight = 0
+        self._wait_samples: deque[float] = deque(maxlen=1000)
+        self.counters = {
+            "submitted": 0, "completed": 0, "failed": 0,
+            "retried": 0, "duplicates": 0, "rejected": 0,
+        }
+
+    # ── lifecycle ────────────────────────────────────────────────────────────
+
+    async def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        tasks = self._tasks + list(self._requeues)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._requeues.clear()
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    # ── submission ───────────────────────────────────────────────────────────
+
+    @property
+    def depth(self) -> int:
+        """Jobs accepted but not started yet."""
+        return self._queue.qsize() + self._waiting
+
+    def session_load(self, session_id) -> int:
+        """The session's jobs that are accepted but not finished, on this process only."""
+        key = str(session_id)
+        return len(self._session_waiting.get(key, ())) + (key in self._busy_sessions)
+
+    def submit(self, msg_id, session_id, flow=None, weight: float = 1) -> bool:
+        """
+        Queue a message for processing. Returns False if this message id is
+        already queued or running; raises QueueFull when the backlog is at capacity.
+        `flow` (default: the session) and `weight` set its fair share.
+        """
+        if msg_id in self._seen:
+            self.counters["duplicates"] += 1
+            return False
+        self.check_room()
+
+        self._seen[msg_id] = True
+        while len(self._seen) > self.dedupe_size:
+            self._seen.popitem(last=False)
+
+        job = Job(msg_id, session_id, flow, weight)
+        self.counters["submitted"] += 1
+        if job.session_id in self._busy_sessions:
+            self._session_waiting.setdefault(job.session_id, deque()).append(job)
+            self._waiting += 1
+        else:
+            self._busy_sessions.add(job.session_id)
+            self._queue.put_nowait(job)
+        return True
+
+    def check_room(self):
+        """Raise QueueFull if submit() would refuse a new job right now."""
+        if self.depth >= self.max_queue:
+            self.counters["rejected"] += 1
+            raise QueueFull(f"job queue is full ({self.max_queue} pending)")
+
+    @asynccontextmanager
+    async def model_slot(self, model_name: str):
+        """Hold one of the model's concurrency slots for the duration of a call."""
+        slot = self._model_slots.get(model_name)
+        if slot is None:
+            slot = asyncio.Semaphore(self.model_limits.get(model_name, self.model_concurrency))
+            self._model_slots[model_name] = slot
+        async with slot:
+            yield
+
+    # ── execution ────────────────────────────────────────────────────────────
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            self._wait_samples.append(time.monotonic() - job.enqueued_at)
+            self._in_flight += 1
+            try:
+                await self.handler(job.msg_id, job.session_id)
+                self.counters["completed"] += 1
+                self._finish(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                job.attempts += 1
+                if job.attempts <= self.max_retries:
+                    print(f"Job for message {job.msg_id} failed ({e}), retry {job.attempts}")
+                    self.counters["retried"] += 1
+                    task = asyncio.create_task(self._requeue(job))
+                    self._requeues.add(task)
+                    task.add_done_callback(self._requeues.discard)
+                else:
+                    print(f"Job for message {job.msg_id} failed permanently: {e}")
+                    self.counters["failed"] += 1
+                    self._finish(job)
+            finally:
+                self._in_flight -= 1
+
+    async def _requeue(self, job: Job):
+        # Exponential backoff with jitter; the session stays busy meanwhile so
+        # later messages in it can't overtake the retried one.
+        await asyncio.sleep(min(30, 2 ** job.attempts) * random.uniform(0.5, 1.0))
+        job.enqueued_at = time.monotonic()
+        self._queue.put_nowait(job)
+
+    def _finish(self, job: Job):
+        self._seen.pop(job.msg_id, None)
+        self._release_session(job.session_id)
+
+    def _release_session(self, session_id: str):
+        waiting = self._session_waiting.get(session_id)
+        if waiting:
+            job = waiting.popleft()
+            self._waiting -= 1
+            if not waiting:
+                del self._session_waiting[session_id]
+            self._queue.put_nowait(job)
+        else:
+            self._busy_sessions.discard(session_id)
+
+    # ── metrics ──────────────────────────────────────────────────────────────
+
+    def stats(self) -> dict:
+        waits = sorted(self._wait_samples)
+
+        def pct(p):
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))], 4) if waits else 0.0
+
+        return {
+            "depth": self.depth,
+            "in_flight": self._in_flight,
+            "workers": self.workers,
+            **self.counters,
+            "wait_seconds": {
+                "avg": round(sum(waits) / len(waits), 4) if waits else 0.0,
+                "p50": pct(0.5),
+                "p95": pct(0.95),
+                "max": round(waits[-1], 4) if waits else 0.0,
+            },
+        }
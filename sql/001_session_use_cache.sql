@@ -0,0 +1,2 @@
+-- Per-session opt-out for the completion cache (completion_cache.py).
+alter table sessions add column if not exists use_cache boolean not null default true;
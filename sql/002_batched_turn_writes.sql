@@ -0,0 +1,33 @@
+-- Combined writes used by db_async.complete_turn / db_async.record_user_message
+-- so a chat turn costs one round-trip per side instead of two or three.
+
+-- Mark the user's message Completed and insert the assistant reply.
+create or replace function complete_turn(p_message_id bigint, p_session_id uuid, p_content text)
+returns setof messages
+language plpgsql
+as $$
+begin
+  update messages set state = 'Completed' where id = p_message_id;
+  return query
+    insert into messages (session_id, role, content, state)
+    values (p_session_id, 'assistant', p_content, 'Completed')
+    returning *;
+end;
+$$;
+
+-- Create the session (or switch its model) and insert the Pending user message.
+create or replace function record_user_message(p_session_id uuid, p_model text, p_content text)
+returns setof messages
+language plpgsql
+as $$
+begin
+  insert into sessions (session_id, title, model)
+  values (p_session_id, 'New Chat', p_model)
+  on conflict (session_id) do update set model = excluded.model
+  where sessions.model is distinct from excluded.model;
+  return query
+    insert into messages (session_id, role, content, state)
+    values (p_session_id, 'User', p_content, 'Pending')
+    returning *;
+end;
+$$;
@@ -0,0 +1,3 @@
+-- Per-session fallback chain for main.route_chat_stream; null means use the
+-- FALLBACK_MODELS default.
+alter table sessions add column if not exists fallback_models text[];
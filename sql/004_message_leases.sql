@@ -0,0 +1,46 @@
+-- Leases on in-flight messages for db_async.claim_message and the recovery
+-- sweeper (recovery.py). A message is owned by the instance that last claimed
+-- it until its lease runs out, after which any instance may take it over.
+
+alter table messages add column if not exists claimed_at timestamptz;
+alter table messages add column if not exists claimed_by text;
+
+-- Only unfinished messages are indexed, so the sweeper's scan stays small.
+create index if not exists messages_state_created_at
+  on messages (state, created_at)
+  where state in ('Pending', 'Processing');
+
+-- Claim one message: Pending, already ours, or with an expired lease.
+create or replace function claim_message(p_message_id bigint, p_owner text, p_lease_seconds int)
+returns setof messages
+language sql
+as $$
+  update messages
+     set state = 'Processing', claimed_at = now(), claimed_by = p_owner
+   where id = p_message_id
+     and (state = 'Pending'
+          or (state = 'Processing'
+              and (claimed_by = p_owner
+                   or coalesce(claimed_at, created_at) < now() - p_lease_seconds * interval '1 second')))
+  returning *;
+$$;
+
+-- Claim a batch of stuck messages: Pending for longer than p_pending_seconds
+-- (the webhook never arrived) or Processing with an expired lease (the
+-- instance handling it died). Rows locked by a concurrent sweep are skipped.
+create or replace function claim_stale_messages(p_owner text, p_pending_seconds int, p_lease_seconds int, p_limit int)
+returns setof messages
+language sql
+as $$
+  update messages
+     set state = 'Processing', claimed_at = now(), claimed_by = p_owner
+   where id in (
+     select id from messages
+      where (state = 'Pending' and created_at < now() - p_pending_seconds * interval '1 second')
+         or (state = 'Processing'
+             and coalesce(claimed_at, created_at) < now() - p_lease_seconds * interval '1 second')
+      order by created_at
+      limit p_limit
+      for update skip locked)
+  returning *;
+$$;
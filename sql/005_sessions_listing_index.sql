@@ -0,0 +1,4 @@
+-- Keyset pagination for the sidebar (db_async.get_sessions_page): each page is
+-- "created_at < cursor order by created_at desc limit n", served from this
+-- index instead of sorting the whole table.
+create index if not exists sessions_created_at on sessions (created_at desc);
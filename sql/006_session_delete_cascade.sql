@@ -0,0 +1,23 @@
+-- Let Postgres remove a session's messages itself, so deleting a chat is one
+-- statement (and one transaction) however long it is.
+
+-- Messages left behind by the old two-step delete would block the constraint
+delete from messages m
+ where not exists (select 1 from sessions s where s.session_id = m.session_id);
+
+alter table messages drop constraint if exists messages_session_id_fkey;
+alter table messages
+  add constraint messages_session_id_fkey
+  foreign key (session_id) references sessions (session_id) on delete cascade;
+
+-- The cascade looks messages up by session_id
+create index if not exists messages_session_id on messages (session_id);
+
+-- Delete many sessions (and, via the cascade, their messages) atomically.
+-- Returns the ids that existed.
+create or replace function delete_sessions(p_session_ids uuid[])
+returns table (session_id uuid)
+language sql
+as $$
+  delete from sessions where sessions.session_id = any(p_session_ids) returning sessions.session_id;
+$$;
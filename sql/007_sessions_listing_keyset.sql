@@ -0,0 +1,9 @@
+-- Sidebar pages are keyed on (created_at, session_id) so sessions created in
+-- the same instant aren't skipped at a page boundary (db_async.get_sessions_page):
+--   created_at < t or (created_at = t and session_id < id)
+--   order by created_at desc, session_id desc limit n
+-- This index serves that order and replaces the created_at-only one.
+create index if not exists sessions_created_at_session_id
+    on sessions (created_at desc, session_id desc);
+
+drop index if exists sessions_created_at;
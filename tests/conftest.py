@@ -0,0 +1,7 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the modules under test from reading a developer's settings
+os.environ["COMPLETION_CACHE"] = "off"
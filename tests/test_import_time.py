@@ -0,0 +1,25 @@
+"""
+The app must import quickly, print nothing and need no credentials: the
+database and HTTP clients (and heavy libraries like supabase) are loaded
+on first use. Same measurement as benchmarks/bench_import.py.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from bench_import import import_once
+
+IMPORT_BUDGET = float(os.getenv("IMPORT_BUDGET", "1.5"))
+
+
+def test_worker_imports_within_budget():
+    best = min((import_once("worker") for _ in range(3)), key=lambda r: r["total"])
+    assert best["total"] <= IMPORT_BUDGET, f"importing worker took {best['total']:.3f}s"
+    assert best["stdout"] == ""
+
+
+def test_supabase_is_not_imported_eagerly():
+    run = import_once("worker")
+    imported = {name.strip() for name, _, _ in run["modules"]}
+    assert "supabase" not in imported
@@ -0,0 +1,97 @@
+"""
+route_chat / route_chat_stream against a fake provider: each fake model
+waits a set time before its first token, then streams its tokens (or fails)
+with a set delay between them. No network is involved.
+"""
+import asyncio
+import time
+
+import pytest
+
+import main
+
+
+class FakeModel:
+    def __init__(self, first_token: float = 0.0, tokens: tuple = ("ok",), chunk_delay: float = 0.0, fail: bool = False):
+        self.first_token = first_token
+        self.tokens = tokens
+        self.chunk_delay = chunk_delay
+        self.fail = fail
+        self.calls = 0
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    models = {}
+
+    async def fake_stream(message, model_name, use_cache=True):
+        model = models[model_name]
+        model.calls += 1
+        await asyncio.sleep(model.first_token)
+        if model.fail:
+            raise RuntimeError(f"{model_name} is down")
+        for i, token in enumerate(model.tokens):
+            if i:
+                await asyncio.sleep(model.chunk_delay)
+            yield token
+
+    monkeypatch.setattr(main, "model_chat_stream", fake_stream)
+    monkeypatch.setattr(main, "latency_tracker", main.LatencyTracker())
+    return models
+
+
+def route(models, **kwargs):
+    return asyncio.run(main.route_chat([{"role": "user", "content": "hi"}], models, **kwargs))
+
+
+def test_first_model_answers(provider):
+    provider["a"] = FakeModel(tokens=("hello", " there"))
+    provider["b"] = FakeModel()
+    assert route(["a", "b"]) == "hello there"
+    assert provider["b"].calls == 0
+
+
+def test_falls_back_when_a_model_fails(provider):
+    provider["a"] = FakeModel(fail=True)
+    provider["b"] = FakeModel(tokens=("from b",))
+    assert route(["a", "b"], hedge=False) == "from b"
+    assert main.latency_tracker.stats()["a"]["errors"] == 1
+
+
+def test_all_models_failing_raises(provider):
+    provider["a"] = FakeModel(fail=True)
+    provider["b"] = FakeModel(fail=True)
+    with pytest.raises(main.ModelUnavailable, match="All models failed"):
+        route(["a", "b"], hedge=False)
+
+
+def test_hedge_races_a_slow_model(provider, monkeypatch):
+    monkeypatch.setattr(main, "HEDGE_DEFAULT_DELAY", 0.05)
+    provider["slow"] = FakeModel(first_token=2.0, tokens=("slow",))
+    provider["fast"] = FakeModel(tokens=("fast",))
+    start = time.perf_counter()
+    assert route(["slow", "fast"], hedge=True) == "fast"
+    assert time.perf_counter() - start < 1.0
+    assert main.latency_tracker.stats()["fast"]["hedges_won"] == 1
+
+
+def test_no_hedge_when_disabled(provider, monkeypatch):
+    monkeypatch.setattr(main, "HEDGE_DEFAULT_DELAY", 0.05)
+    provider["slow"] = FakeModel(first_token=0.2, tokens=("slow",))
+    provider["fast"] = FakeModel(tokens=("fast",))
+    assert route(["slow", "fast"], hedge=False) == "slow"
+    assert provider["fast"].calls == 0
+
+
+def test_deadline_bounds_time_to_first_token(provider):
+    provider["a"] = FakeModel(first_token=2.0)
+    start = time.perf_counter()
+    with pytest.raises(main.ModelUnavailable, match="within"):
+        route(["a"], deadline=0.1, hedge=False)
+    assert time.perf_counter() - start < 1.0
+
+
+def test_deadline_does_not_cut_off_a_streaming_reply(provider):
+    tokens = tuple(f"t{i} " for i in range(10))
+    provider["a"] = FakeModel(tokens=tokens, chunk_delay=0.03)
+    assert route(["a"], deadline=0.1, hedge=False) == "".join(tokens)
@@ -0,0 +1,130 @@
+"""
+JobScheduler and FairQueue with a fake handler: per-session ordering,
+dedupe of redelivered message ids, and weighted fair order across flows.
+"""
+import asyncio
+
+from scheduler import FairQueue, Job, JobScheduler
+
+
+def run_jobs(submissions, handler_delay=0.01, fail=(), **kwargs):
+    """Submit (msg_id, session_id) pairs, wait for the queue to drain and
+    return (calls in order, submit results, scheduler)."""
+    calls = []
+    running = set()
+
+    async def handler(msg_id, session_id):
+        assert session_id not in running, f"two jobs of session {session_id} ran at once"
+        running.add(session_id)
+        calls.append((msg_id, session_id))
+        try:
+            await asyncio.sleep(handler_delay)
+            if msg_id in fail:
+                raise RuntimeError("boom")
+        finally:
+            running.discard(session_id)
+
+    async def main():
+        scheduler = JobScheduler(handler, workers=4, **kwargs)
+        await scheduler.start()
+        results = [scheduler.submit(msg_id, session_id) for msg_id, session_id in submissions]
+        while scheduler.depth or scheduler.stats()["in_flight"] or scheduler._requeues:
+            await asyncio.sleep(0.005)
+        await scheduler.stop()
+        return results, scheduler
+
+    results, scheduler = asyncio.run(main())
+    return calls, results, scheduler
+
+
+def test_jobs_of_a_session_run_in_order_one_at_a_time():
+    submissions = [(1, "a"), (2, "b"), (3, "a"), (4, "a"), (5, "b")]
+    calls, results, _ = run_jobs(submissions)
+    assert all(results)
+    assert [m for m, s in calls if s == "a"] == [1, 3, 4]
+    assert [m for m, s in calls if s == "b"] == [2, 5]
+
+
+def test_other_sessions_are_not_held_up_by_a_busy_one():
+    calls, _, _ = run_jobs([(1, "a"), (2, "a"), (3, "a"), (4, "b")], handler_delay=0.05)
+    # b's only job starts alongside a's first one, not after all of a's
+    assert [m for m, _ in calls].index(4) < [m for m, _ in calls].index(2)
+
+
+def test_redelivered_id_is_ignored_while_queued():
+    calls, results, scheduler = run_jobs([(1, "a"), (1, "a"), (2, "a"), (1, "b")])
+    assert results == [True, False, True, False]
+    assert [m for m, _ in calls] == [1, 2]
+    assert scheduler.counters["duplicates"] == 2
+
+
+def test_finished_id_can_be_queued_again():
+    async def main():
+        calls = []
+
+        async def handler(msg_id, session_id):
+            calls.append(msg_id)
+
+        scheduler = JobScheduler(handler, workers=1)
+        await scheduler.start()
+        assert scheduler.submit(1, "a")
+        while scheduler.depth or scheduler.stats()["in_flight"]:
+            await asyncio.sleep(0.005)
+        await asyncio.sleep(0.01)
+        assert scheduler.submit(1, "a")   # e.g. re-enqueued by the recovery sweeper
+        await asyncio.sleep(0.01)
+        await scheduler.stop()
+        return calls
+
+    assert asyncio.run(main()) == [1, 1]
+
+
+def test_failed_job_is_retried_before_the_session_moves_on():
+    calls, _, scheduler = run_jobs([(1, "a"), (2, "a")], fail={1}, max_retries=1)
+    assert [m for m, _ in calls] == [1, 1, 2]
+    assert scheduler.counters["retried"] == 1
+    assert scheduler.counters["failed"] == 1
+
+
+def test_stop_cancels_pending_retries():
+    async def main():
+        async def handler(msg_id, session_id):
+            raise RuntimeError("boom")
+
+        scheduler = JobScheduler(handler, workers=1, max_retries=3)
+        await scheduler.start()
+        scheduler.submit(1, "a")
+        while not scheduler._requeues:
+            await asyncio.sleep(0.005)
+        requeues = list(scheduler._requeues)
+        await scheduler.stop()
+        return requeues, scheduler
+
+    requeues, scheduler = asyncio.run(main())
+    assert all(task.cancelled() for task in requeues)
+    assert not scheduler._requeues
+
+
+def serve(jobs: list[Job], n: int) -> list[str]:
+    """Queue `jobs` on a FairQueue and return the flows of the first `n` served."""
+    async def main():
+        queue = FairQueue()
+        for job in jobs:
+            queue.put_nowait(job)
+        return [(await queue.get()).flow for _ in range(n)]
+    return asyncio.run(main())
+
+
+def test_fair_queue_serves_flows_by_weight():
+    jobs = []
+    for i in range(12):
+        jobs.append(Job(i, f"heavy-{i}", flow="heavy", weight=3))
+        jobs.append(Job(100 + i, f"light-{i}", flow="light", weight=1))
+    order = serve(jobs, 12)
+    assert order.count("heavy") == 9
+    assert order.count("light") == 3
+
+
+def test_fair_queue_does_not_starve_a_late_flow():
+    jobs = [Job(i, f"s{i}", flow="bulk") for i in range(20)] + [Job(99, "late", flow="late")]
+    assert "late" in serve(jobs, 3)
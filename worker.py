@@ -1,22 +1,94 @@
+import os
+import time
 import uuid
 import json
 import asyncio
-
-from main import new_chat, model_chat
-from db_init import (
-    send_message_to_db, get_chat_history, update_message_state,
-    update_session_title, create_session, update_session_model,
-    get_sessions, supabase
+import hashlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+# Load .env once, before the modules below read their settings at import
+# (LOAD_DOTENV=0 skips it, e.g. to check the app imports without settings)
+from dotenv import load_dotenv
+if os.getenv("LOAD_DOTENV", "1") == "1":
+    load_dotenv()
+
+from main import (
+    new_chat, route_chat, route_chat_stream, model_chain,
+    latency_tracker, ModelUnavailable
+)
+from context import build_context, forget_session
+from scheduler import JobScheduler, QueueFull
+from recovery import RecoverySweeper
+from admission import AdmissionControl, Rejected, client_key, client_weight
+from delivery import create_broker, Outbox
+import metrics
+from metrics import span, MetricsMiddleware
+from readiness import Readiness
+from openrouter_client import close_client, fetch_key_info
+from db_init import session_list_cache, HISTORY_COLUMNS, STATUS_COLUMNS
+from db_async import (
+    get_chat_history_page, update_message_state,
+    update_session_title, update_session_model,
+    get_sessions_page, get_session, delete_session, delete_sessions,
+    update_session_cache, update_session_fallbacks, complete_turn, record_user_message,
+    claim_message, renew_message_lease, claim_stale_messages, cancel_turn, message_in_session,
+    ping as ping_db, close_client as close_db_client
 )
-from fastapi import FastAPI, BackgroundTasks, WebSocket, WebSocketDisconnect
+from completion_cache import completion_cache
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, PlainTextResponse
 from pydantic import BaseModel
 
-from model_list import final_models
-
-app = FastAPI()
+from model_registry import registry
+
+# Stream tokens to the browser as they are generated ("delta" frames) instead
+# of sending the whole reply once the model has finished.
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "1") == "1"
+
+# Titles for new chats are generated from the user's first message in
+# parallel with the reply, using a cheap model, and fall back to a heuristic
+# title if that takes longer than TITLE_TIMEOUT seconds.
+TITLE_MODEL = os.getenv("TITLE_MODEL", "openai/gpt-4.1-mini")
+TITLE_TIMEOUT = float(os.getenv("TITLE_TIMEOUT", "8"))
+
+# How new messages reach the job scheduler:
+#   webhook  Supabase's database webhook calls /process-message (default)
+#   direct   /send-message enqueues right after the insert; the webhook is
+#            still accepted for rows written by other writers, and a message
+#            that was already dispatched is ignored
+DISPATCH_MODE = os.getenv("DISPATCH_MODE", "webhook")
+
+# Cancel a session's running replies when its socket goes away and doesn't
+# come back within CANCEL_GRACE seconds (a page reload reconnects in time)
+CANCEL_ON_DISCONNECT = os.getenv("CANCEL_ON_DISCONNECT", "0") == "1"
+CANCEL_GRACE = float(os.getenv("CANCEL_GRACE", "10"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await broker.start(_deliver_local)
+    await registry.start()
+    await scheduler.start()
+    await sweeper.start()
+    # The database and HTTP clients are created on first use; running the
+    # readiness checks once in the background opens them (and fills the
+    # /ready cache) without holding up startup
+    warm_up = asyncio.create_task(readiness.check())
+    yield
+    warm_up.cancel()
+    await sweeper.stop()
+    await scheduler.stop()
+    await registry.stop()
+    await broker.stop()
+    await close_client()
+    await close_db_client()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,6 +96,27 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+
+# Compress REST responses of at least COMPRESSION_MIN_SIZE bytes:
+#   COMPRESSION=gzip     (default)
+#   COMPRESSION=brotli   brotli where the client accepts it, else gzip (pip install brotli-asgi)
+#   COMPRESSION=off
+# WebSocket frames are compressed separately by uvicorn's permessage-deflate,
+# which is on by default (--ws-per-message-deflate).
+COMPRESSION = os.getenv("COMPRESSION", "gzip")
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+
+if COMPRESSION == "gzip":
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+elif COMPRESSION == "brotli":
+    try:
+        from brotli_asgi import BrotliMiddleware
+    except ImportError:
+        raise RuntimeError("COMPRESSION=brotli needs the brotli-asgi package: pip install brotli-asgi")
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+elif COMPRESSION != "off":
+    raise ValueError(f"Unknown COMPRESSION: {COMPRESSION}")
 
 # Serve the frontend
 app.mount("/frontend", StaticFiles(directory="frontend"), name="frontend")
@@ -34,9 +127,18 @@ def serve_ui():
 
 
 # ── Connection registry ──────────────────────────────────────────────────────
-# Maps session_id -> (WebSocket, asyncio event loop)
-# Used by the webhook to push responses back to the right browser tab
-active_connections: dict[str, tuple[WebSocket, asyncio.AbstractEventLoop]] = {}
+# Maps session_id -> WebSocket for the sockets held by *this* process.
+# Replies are published through the broker, and each process delivers the
+# ones addressed to its own sockets.
+active_connections: dict[str, WebSocket] = {}
+broker = create_broker()
+# Recent frames per session, replayed to clients that reconnect with ?last_seq=
+outbox = Outbox()
+
+# The server pings every WS_PING_INTERVAL seconds; a socket that sends nothing
+# (not even a pong) for WS_PING_INTERVAL + WS_PING_TIMEOUT is dropped.
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "20"))
+WS_PING_TIMEOUT = float(os.getenv("WS_PING_TIMEOUT", "10"))
 
 
 # ── Webhook handler (called by Supabase on new Pending message) ──────────────
@@ -45,62 +147,284 @@ class WebhookPayload(BaseModel):
     record: dict
 
 
-def process_message(msg_id: int, current_session_id: uuid.UUID):
+async def process_message(msg_id: int, current_session_id: uuid.UUID):
+    # Leased when it was queued; if it waited past the lease, the sweeper may
+    # have handed it to another instance
+    if not await renew_message_lease(msg_id):
+        print(f"Message {msg_id} is already being processed elsewhere, skipping")
+        return
     try:
-        history = get_chat_history(current_session_id)
-
-        session_metadata = supabase.table("sessions").select("model, title").eq("session_id", current_session_id).single().execute()
-        model_name = session_metadata.data["model"]
+        with span("session_fetch"):
+            session_metadata = await get_session(current_session_id)
+        if not session_metadata:
+            raise ValueError(f"Session {current_session_id} not found")
+        model_name = session_metadata["model"]
         print(f"Processing with model: {model_name}")
 
-        query = [{"role": msg["role"].lower(), "content": msg["content"]} for msg in history]
-        result = model_chat(query, model_name)
+        with span("history_fetch", model_name):
+            query = await build_context(current_session_id, model_name)
+
+        if session_metadata["title"] == "New Chat" and str(current_session_id) not in _titles_pending:
+            user_text = next((m["content"] for m in reversed(query) if m["role"] == "user"), "")
+            _titles_pending.add(str(current_session_id))
+            _spawn(_generate_title(current_session_id, user_text))
+
+        use_cache = session_metadata.get("use_cache", True)
+        models = model_chain(model_name, session_metadata.get("fallback_models"))
+        parts = []
+        async with scheduler.model_slot(model_name):
+            with span("model_total", model_name):
+                # The model call runs as its own task so cancel_message can
+                # abort it without killing the scheduler worker running us
+                reply = asyncio.create_task(_reply(msg_id, current_session_id, query, models, use_cache, parts))
+                entry = _in_flight[msg_id] = {"session_id": str(current_session_id), "task": reply, "cancelled": False}
+                if _cancel_requested.pop(msg_id, None):
+                    _abort(entry)   # cancelled while still queued
+                try:
+                    result = await reply
+                except asyncio.CancelledError:
+                    if not entry["cancelled"]:
+                        raise
+                    result = None
+                finally:
+                    _in_flight.pop(msg_id, None)
         print("Called API with model: ", model_name)
 
+        if result is None:
+            partial = "".join(parts)
+            with span("db_write", model_name):
+                await cancel_turn(msg_id, current_session_id, partial)
+            print(f"Worker Cancelled message id {msg_id}")
+            await _push_to_ws(current_session_id, {"type": "cancelled", "msg_id": msg_id, "content": partial})
+            return
+
         if result != "ERROR":
-            update_message_state(msg_id, "Completed")
-            send_message_to_db(current_session_id, "assistant", result, "Completed")
+            with span("db_write", model_name):
+                await complete_turn(msg_id, current_session_id, result)
             print(f"Worker Completed for message id {msg_id}")
         else:
-            update_message_state(msg_id, "Failed")
+            with span("db_write", model_name):
+                await update_message_state(msg_id, "Failed")
             print(f"Worker Failed for message id {msg_id}")
-            _push_to_ws(current_session_id, {"type": "error", "message": "Model returned an error."})
+            await _push_to_ws(current_session_id, {"type": "error", "message": "Model returned an error."})
             return
 
-        # Title generation
-        title_result = session_metadata.data["title"]
-        new_title = title_result
-        print(f"Current title: {title_result}")
-        if title_result == "New Chat":
-            new_title = new_chat(result)
-            update_session_title(current_session_id, new_title)
-            print("Title changed to:", new_title)
-
-        _push_to_ws(current_session_id, {
+        await _push_to_ws(current_session_id, {
             "type": "message",
             "role": "assistant",
             "content": result,
-            "title": new_title
         })
 
     except Exception as e:
         print(f"ERROR: {e}")
-        update_message_state(msg_id, "Failed")
-        _push_to_ws(current_session_id, {"type": "error", "message": str(e)})
+        await update_message_state(msg_id, "Failed")
+        await _push_to_ws(current_session_id, {"type": "error", "message": str(e)})
 
 
-def _push_to_ws(session_id: uuid.UUID, payload: dict):
-    """Thread-safe: push a message to the WebSocket for this session if connected."""
-    entry = active_connections.get(str(session_id))
-    if not entry:
-        print(f"No active WS for session {session_id}, skipping push")
-        return
-    ws, loop = entry
-    asyncio.run_coroutine_threadsafe(ws.send_text(json.dumps(payload)), loop)
+# ── In-flight replies ────────────────────────────────────────────────────────
+# msg_id -> {"session_id", "task", "cancelled"} for model calls running in
+# this process. Cancelling the task closes the upstream OpenRouter stream.
+# A cancel for a message that is still queued is remembered, and the message
+# is skipped when its turn comes. Message ids are sequential, so a cancel only
+# acts on a message of the session that asked for it.
+_in_flight: dict[int, dict] = {}
+_cancel_requested: OrderedDict[int, bool] = OrderedDict()
+
+
+def _abort(entry: dict):
+    entry["cancelled"] = True
+    entry["task"].cancel()
+
+
+async def cancel_message(msg_id: int, session_id) -> bool | None:
+    """
+    Abort one of a session's replies. Returns True if it was running here,
+    False if it will be skipped when it starts, None if the message isn't
+    that session's.
+    """
+    session_id = str(session_id)
+    if (entry := _in_flight.get(msg_id)) is None:
+        # Not running here: only remember the cancel for a message we've
+        # confirmed belongs to the session
+        if not await message_in_session(msg_id, session_id):
+            return None
+        if (entry := _in_flight.get(msg_id)) is None:   # may have started meanwhile
+            _cancel_requested[msg_id] = True
+            while len(_cancel_requested) > 1000:
+                _cancel_requested.popitem(last=False)
+            return False
+    if entry["session_id"] != session_id:
+        return None
+    _abort(entry)
+    return True
+
+
+def cancel_session(session_id: str) -> list[int]:
+    """Abort every reply running here for a session; returns their message ids."""
+    msg_ids = [m for m, entry in _in_flight.items() if entry["session_id"] == session_id]
+    for msg_id in msg_ids:
+        _abort(_in_flight[msg_id])
+    return msg_ids
+
+
+async def _cancel_if_gone(session_id: str):
+    await asyncio.sleep(CANCEL_GRACE)
+    if session_id not in active_connections and (msg_ids := cancel_session(session_id)):
+        print(f"Cancelled {len(msg_ids)} reply(s) for disconnected session {session_id}")
+
+
+# Keeps references to fire-and-forget tasks so they aren't garbage collected
+_background_tasks: set[asyncio.Task] = set()
+# Sessions whose title is being generated right now
+_titles_pending: set[str] = set()
+
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def _generate_title(session_id: uuid.UUID, user_text: str):
+    """Name a new chat from its first message and push it as a title frame."""
+    try:
+        with span("title", TITLE_MODEL):
+            title = await asyncio.wait_for(new_chat(user_text, TITLE_MODEL), TITLE_TIMEOUT)
+        title = (title or "").strip().strip('"').strip()
+    except Exception as e:
+        print(f"Title generation failed ({e!r}), using fallback")
+        title = ""
+    if not title:
+        title = _fallback_title(user_text)
+
+    try:
+        await update_session_title(session_id, title)
+        print("Title changed to:", title)
+        await _push_to_ws(session_id, {"type": "title", "title": title})
+    finally:
+        _titles_pending.discard(str(session_id))
+
+
+def _fallback_title(text: str) -> str:
+    words = text.split()
+    if not words:
+        return "Untitled Chat"
+    title = " ".join(words[:6])
+    if len(title) > 40:
+        title = title[:40].rsplit(" ", 1)[0] or title[:40]
+    if len(words) > 6 or len(title) < len(text.strip()):
+        title += "…"
+    return title[0].upper() + title[1:]
+
+
+async def _reply(msg_id: int, session_id: uuid.UUID, query: list, models: list[str], use_cache: bool, parts: list) -> str:
+    """Generate the reply (streamed or not); "ERROR" if no model produced one."""
+    if STREAM_RESPONSES:
+        return await _stream_reply(msg_id, session_id, query, models, use_cache, parts)
+    try:
+        # A buffered reply has no first token; its time is in model_total
+        return await route_chat(query, models, use_cache=use_cache)
+    except ModelUnavailable as e:
+        print(f"API ERROR: {e}")
+        return "ERROR"
+
+
+async def _stream_reply(msg_id: int, session_id: uuid.UUID, query: list, models: list[str], use_cache: bool = True, parts: list = None) -> str:
+    """
+    Forward each token to the browser as a delta frame and return the full
+    reply. Tokens are also collected in `parts`, so a cancelled reply can be
+    saved as far as it got. The message's lease is renewed as tokens arrive
+    (a round-trip only once it is a third used).
+    """
+    parts = [] if parts is None else parts
+    start = time.perf_counter()
+    leased = True
+    try:
+        async for delta in route_chat_stream(query, models, use_cache=use_cache):
+            if not parts:
+                metrics.stage_seconds.observe(time.perf_counter() - start, stage="model_first_token", model=models[0])
+            parts.append(delta)
+            await _push_to_ws(session_id, {"type": "delta", "content": delta})
+            if leased and not await renew_message_lease(msg_id):
+                leased = False
+                print(f"Lost the lease on message {msg_id} while replying")
+    except ModelUnavailable as e:
+        print(f"API ERROR: {e}")
+        if parts:
+            raise
+    return "".join(parts) if parts else "ERROR"
+
+
+async def _push_to_ws(session_id: uuid.UUID, payload: dict):
+    """Publish a frame for this session; the process holding its socket sends it."""
+    try:
+        with span("ws_push"):
+            await broker.publish(str(session_id), payload)
+    except Exception as e:
+        print(f"WS publish failed for session {session_id}: {e}")
+
+
+async def _deliver_local(session_id: str, payload: dict) -> bool:
+    """Keep a frame for replay and send it to this session's socket if it is connected here."""
+    outbox.record(session_id, payload)
+    ws = active_connections.get(session_id)
+    if not ws:
+        return False
+    try:
+        await ws.send_text(json.dumps(payload))
+    except Exception as e:
+        print(f"WS push failed for session {session_id}: {e}")
+    return True
+
+
+# Runs process_message on a fixed worker pool, one message per session at a time
+scheduler = JobScheduler(process_message)
+# Re-enqueues messages left Pending/Processing by a crashed or restarted instance
+sweeper = RecoverySweeper(scheduler, claim_stale_messages)
+# Rate limits checked by /send-message
+admission = AdmissionControl()
+# session_id -> client that last sent to it, so webhook jobs are queued
+# fairly under the client rather than the session
+_session_clients: OrderedDict[str, str] = OrderedDict()
+
+
+def _remember_client(session_id: str, client: str):
+    _session_clients[session_id] = client
+    _session_clients.move_to_end(session_id)
+    while len(_session_clients) > 10000:
+        _session_clients.popitem(last=False)
+
+metrics.registry.gauge("job_queue_depth", "Messages accepted but not started.", lambda: scheduler.depth)
+metrics.registry.gauge("jobs_in_flight", "Messages being processed.", lambda: scheduler.stats()["in_flight"])
+metrics.registry.gauge(
+    "jobs_total", "Job outcomes since start.",
+    lambda: {(k,): v for k, v in scheduler.counters.items()}, labels=("outcome",),
+)
+metrics.registry.gauge("messages_recovered_total", "Stuck messages re-enqueued by the sweeper.", lambda: sweeper.recovered)
+metrics.registry.gauge("websocket_connections", "Sockets held by this process.", lambda: len(active_connections))
+metrics.registry.gauge(
+    "completion_cache_lookups_total", "Completion cache lookups.",
+    lambda: {("hit",): completion_cache.hits, ("miss",): completion_cache.misses} if completion_cache else {},
+    labels=("result",),
+)
+
+
+async def _lease_and_submit(msg_id: int, session_id, client: str = None) -> bool:
+    """
+    Lease the message to this instance and queue it. Returns False if it is
+    already queued here or another instance holds it; raises QueueFull
+    (before leasing, so a refused message isn't left under our lease).
+    """
+    scheduler.check_room()
+    if not await claim_message(msg_id):
+        print(f"Message {msg_id} is already being processed elsewhere, skipping")
+        return False
+    return scheduler.submit(msg_id, session_id, client, client_weight(client))
 
 
 @app.post("/process-message")
-async def webhook(payload: WebhookPayload, background_tasks: BackgroundTasks):
+async def webhook(payload: WebhookPayload):
     record = payload.record
 
     if record.get("state") != "Pending":
@@ -110,41 +434,228 @@ async def webhook(payload: WebhookPayload, background_tasks: BackgroundTasks):
     current_session_id = record["session_id"]
     print(f"Webhook received for message id {msg_id} and session id {current_session_id}")
 
-    background_tasks.add_task(process_message, msg_id, current_session_id)
+    client = _session_clients.get(str(current_session_id))
+    try:
+        accepted = await _lease_and_submit(msg_id, current_session_id, client)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if not accepted:
+        return {"status": "duplicate"}
     return {"status": "ok"}
 
 
 # ── REST endpoints ───────────────────────────────────────────────────────────
 
+# Browsers may reuse the catalog for this long, then revalidate with the ETag
+MODELS_MAX_AGE = int(os.getenv("MODELS_MAX_AGE", "300"))
+
+
 @app.get("/models")
-def list_models():
-    return {"models": final_models}
+async def list_models(request: Request):
+    headers = {"ETag": registry.etag, "Cache-Control": f"public, max-age={MODELS_MAX_AGE}"}
+    if request.headers.get("if-none-match") == registry.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(registry.listing_body, media_type="application/json", headers=headers)
 
 
 @app.get("/sessions")
-def list_sessions():
-    return {"sessions": get_sessions()}
+async def list_sessions(request: Request, after: str | None = None, limit: int = Query(50, ge=1, le=200)):
+    """
+    One page of the sidebar, newest first. Pass the returned `next_after` as
+    `after` for the next page. Responses carry an ETag; the browser revalidates
+    every time (no-cache) and gets a 304 when the page hasn't changed.
+    """
+    sessions, next_after, etag = await get_sessions_page(after, limit)
+    headers = {"Cache-Control": "no-cache"}
+    if etag:
+        headers["ETag"] = etag
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+    return JSONResponse({"sessions": sessions, "next_after": next_after}, headers=headers)
 
 
 @app.get("/session/{session_id}")
-def get_session(session_id: str):
-    res = supabase.table("sessions").select("*").eq("session_id", session_id).execute()
-    if res.data:
-        return res.data[0]
-    return {}
+async def get_session_route(session_id: str):
+    return await get_session(session_id) or {}
 
 
 @app.delete("/session/{session_id}")
-def delete_session_route(session_id: str):
-    supabase.table("messages").delete().eq("session_id", session_id).execute()
-    supabase.table("sessions").delete().eq("session_id", session_id).execute()
+async def delete_session_route(session_id: str):
+    await delete_session(session_id)
+    forget_session(session_id)
     return {"status": "deleted"}
 
 
+# ── Bulk deletion ────────────────────────────────────────────────────────────
+# Deleting many sessions runs as a background job in batches of
+# DELETE_BATCH_SIZE (one transactional RPC each); the request returns a job
+# id at once and the job's progress can be polled. Job status lives in this
+# process only: poll the instance that accepted the job (behind a load
+# balancer, use sticky sessions), and expect a 404 after it restarts. The
+# most recent DELETE_JOBS_KEPT jobs are remembered, finished ones for
+# DELETE_JOB_TTL seconds.
+DELETE_BATCH_SIZE = int(os.getenv("DELETE_BATCH_SIZE", "100"))
+DELETE_JOBS_KEPT = int(os.getenv("DELETE_JOBS_KEPT", "1000"))
+DELETE_JOB_TTL = float(os.getenv("DELETE_JOB_TTL", "3600"))
+_delete_jobs: OrderedDict[str, dict] = OrderedDict()
+
+
+class BulkDeletePayload(BaseModel):
+    session_ids: list[uuid.UUID]
+
+
+async def _run_delete_job(job: dict, session_ids: list[uuid.UUID]):
+    job["status"] = "running"
+    for i in range(0, len(session_ids), DELETE_BATCH_SIZE):
+        batch = session_ids[i:i + DELETE_BATCH_SIZE]
+        deleted = await delete_sessions(batch)
+        if deleted is None:
+            job["failed"] += len(batch)
+            continue
+        job["deleted"] += len(deleted)
+        for session_id in batch:
+            forget_session(str(session_id))
+    job["status"] = "failed" if job["failed"] else "done"
+    job["finished_at"] = time.time()
+
+
+def _prune_delete_jobs():
+    while len(_delete_jobs) > DELETE_JOBS_KEPT:
+        _delete_jobs.popitem(last=False)
+    cutoff = time.time() - DELETE_JOB_TTL
+    for job_id in [j for j, job in _delete_jobs.items() if job["finished_at"] and job["finished_at"] < cutoff]:
+        del _delete_jobs[job_id]
+
+
+@app.post("/sessions/delete", status_code=202)
+async def bulk_delete_sessions(payload: BulkDeletePayload):
+    """Delete many sessions in the background; poll GET /sessions/delete/{job_id}."""
+    session_ids = list(dict.fromkeys(payload.session_ids))
+    job_id = uuid.uuid4().hex
+    job = {
+        "job_id": job_id, "status": "queued", "requested": len(session_ids),
+        "deleted": 0, "failed": 0, "created_at": time.time(), "finished_at": None,
+    }
+    _delete_jobs[job_id] = job
+    _prune_delete_jobs()
+    _spawn(_run_delete_job(job, session_ids))
+    return job
+
+
+@app.get("/sessions/delete/{job_id}")
+async def bulk_delete_status(job_id: str):
+    _prune_delete_jobs()
+    job = _delete_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown delete job")
+    return job
+
+
+@app.get("/metrics")
+async def metrics_route():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/stats")
+async def stats():
+    return {
+        "session_list_cache": session_list_cache.stats(),
+        "completion_cache": completion_cache.stats() if completion_cache else None,
+        "jobs": scheduler.stats(),
+        "recovery": sweeper.stats(),
+        "outbox": outbox.stats(),
+        "models": latency_tracker.stats(),
+    }
+
+
+async def _check_openrouter():
+    # A tiny authenticated request: reachable and the key is accepted
+    response = await fetch_key_info()
+    if response.status_code >= 400:
+        raise RuntimeError(f"HTTP {response.status_code}")
+
+
+async def _check_scheduler():
+    return scheduler.running
+
+
+readiness = Readiness()
+readiness.add("database", ping_db)
+readiness.add("broker", lambda: broker.ping())
+readiness.add("scheduler", _check_scheduler)
+if not registry.offline:
+    readiness.add("openrouter", _check_openrouter, required=False)
+
+
+@app.get("/ready")
+async def ready():
+    report = await readiness.check()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+
+def _conditional_json(request: Request, body: dict) -> Response:
+    """JSON response with an ETag over its content; 304 if the client already has it."""
+    etag = '"' + hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode()).hexdigest()[:32] + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(body, headers=headers)
+
+
 @app.get("/history/{session_id}")
-def chat_history(session_id: uuid.UUID):
-    msgs = get_chat_history(session_id) or []
-    return {"messages": msgs}
+async def chat_history(
+    request: Request,
+    session_id: uuid.UUID,
+    before: int | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    view: str = Query("messages", pattern="^(messages|status)$"),
+):
+    """
+    Newest page of messages; pass `before=next_before` to load older ones.
+    view=status returns only id, state and created_at, for refreshing states.
+    """
+    columns = STATUS_COLUMNS if view == "status" else HISTORY_COLUMNS
+    msgs, next_before = await get_chat_history_page(session_id, before, limit, columns)
+    return _conditional_json(request, {"messages": msgs, "next_before": next_before})
+
+
+# ── Combined reads ───────────────────────────────────────────────────────────
+# Everything the page needs on load or on switching chats in one response,
+# with the underlying queries run concurrently, so a high-latency client pays
+# one round-trip instead of two or three.
+
+async def _session_snapshot(session_id: uuid.UUID, limit: int = 50) -> dict:
+    session, (msgs, next_before) = await asyncio.gather(
+        get_session(session_id), get_chat_history_page(session_id, None, limit, HISTORY_COLUMNS)
+    )
+    return {"session": session or {}, "messages": msgs, "next_before": next_before}
+
+
+@app.get("/session/{session_id}/full")
+async def get_session_full(request: Request, session_id: uuid.UUID, limit: int = Query(50, ge=1, le=200)):
+    """Session row plus the newest page of history (same shape as /history)."""
+    return _conditional_json(request, await _session_snapshot(session_id, limit))
+
+
+@app.get("/bootstrap")
+async def bootstrap_route(session_id: uuid.UUID | None = None):
+    """
+    Model catalog and the first page of the sidebar, plus the session snapshot
+    when `session_id` is given.
+    """
+    if session_id is None:
+        sessions, next_after, _ = await get_sessions_page()
+        snapshot = None
+    else:
+        (sessions, next_after, _), snapshot = await asyncio.gather(
+            get_sessions_page(), _session_snapshot(session_id)
+        )
+    return {
+        "models": registry.listing(),
+        "sessions": sessions,
+        "next_after": next_after,
+        "session": snapshot,
+    }
 
 
 class SendMessagePayload(BaseModel):
@@ -154,46 +665,161 @@ class SendMessagePayload(BaseModel):
 
 
 @app.post("/send-message")
-def send_message_route(payload: SendMessagePayload):
+async def send_message_route(payload: SendMessagePayload, request: Request):
     """
     Frontend calls this to save a user message as Pending.
-    Supabase webhook then fires /process-message to handle it.
+    Supabase webhook then fires /process-message to handle it, or in direct
+    mode it is queued for processing right away. Clients or sessions over
+    their limits get a 429 with Retry-After before anything is saved.
     """
-    existing = supabase.table("sessions").select("session_id").eq("session_id", payload.session_id).execute()
-    if not existing.data:
-        create_session(payload.session_id, "New Chat", payload.model)
-    else:
-        update_session_model(payload.session_id, payload.model)
-
-    db_res = send_message_to_db(payload.session_id, "User", payload.content, "Pending")
+    client = client_key(request)
+    try:
+        admission.check(client, payload.session_id, scheduler.session_load(payload.session_id))
+    except Rejected as e:
+        return JSONResponse(
+            {"status": "error", "message": f"Too many messages, try again in {e.retry_after}s", "reason": e.reason},
+            status_code=429,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    _remember_client(str(payload.session_id), client)
+
+    db_res = await record_user_message(payload.session_id, payload.model, payload.content)
     if not db_res or not db_res.data:
         return {"status": "error", "message": "Failed to save message"}
 
     msg_id = db_res.data[0]["id"]
     print(f"Message saved with id {msg_id} for session {payload.session_id}")
-    return {"status": "ok", "msg_id": msg_id}
+
+    dispatched = False
+    if DISPATCH_MODE == "direct":
+        try:
+            dispatched = await _lease_and_submit(msg_id, payload.session_id, client)
+        except QueueFull as e:
+            # Still saved as Pending; the webhook can pick it up later
+            print(f"Direct dispatch of message {msg_id} failed: {e}")
+    return {"status": "ok", "msg_id": msg_id, "dispatched": dispatched}
+
+
+@app.post("/message/{msg_id}/cancel")
+async def cancel_message_route(msg_id: int, session_id: uuid.UUID):
+    """
+    Stop generating the reply to a message of `session_id`. What was generated
+    so far is saved with state Cancelled. A message that hasn't started yet
+    is skipped. Only replies running on this instance can be stopped.
+    """
+    running = await cancel_message(msg_id, session_id)
+    if running is None:
+        raise HTTPException(status_code=404, detail="No such message in this session")
+    return {"status": "cancelled" if running else "cancel_requested"}
 
 
 # ── WebSocket — receive-only, used to push responses back to browser ─────────
 
 @app.websocket("/ws/{session_id}")
-async def websocket_endpoint(websocket: WebSocket, session_id: str):
+async def websocket_endpoint(
+    websocket: WebSocket, session_id: str, bootstrap: bool = False, last_seq: int | None = None
+):
+    """
+    Server frames carry a `seq`. A client reconnecting with ?last_seq= is first
+    sent the frames it missed, or a {"type": "resync"} frame if they are no
+    longer available and it should refetch history. With ?bootstrap=1 the
+    first frame is the session snapshot (see /session/{id}/full).
+    """
     await websocket.accept()
-    loop = asyncio.get_event_loop()
-    active_connections[session_id] = (websocket, loop)
     print(f"WS connected: {session_id}")
 
+    if bootstrap:
+        try:
+            snapshot = await _session_snapshot(uuid.UUID(session_id))
+            await websocket.send_text(json.dumps({"type": "bootstrap", **snapshot}, default=str))
+        except Exception as e:
+            print(f"WS bootstrap failed for {session_id}: {e}")
+
     try:
-        while True:
-            # Keep connection alive; handle model change notifications from frontend
-            raw = await websocket.receive_text()
+        if last_seq is not None:
+            # Replay until caught up, then register without awaiting in
+            # between so no frame can fall into the gap
+            while frames := outbox.since(session_id, last_seq):
+                for frame in frames:
+                    await websocket.send_text(json.dumps(frame))
+                    last_seq = frame["seq"]
+            if frames is None:
+                await websocket.send_text(json.dumps({"type": "resync"}))
+        active_connections[session_id] = websocket
+
+        pinger = asyncio.create_task(_ping(websocket))
+        try:
+            while True:
+                raw = await asyncio.wait_for(websocket.receive_text(), WS_PING_INTERVAL + WS_PING_TIMEOUT)
+                _handle_client_frame(session_id, raw)
+        finally:
+            pinger.cancel()
     except WebSocketDisconnect:
         print(f"WS disconnected: {session_id}")
+    except asyncio.TimeoutError:
+        print(f"WS heartbeat timed out: {session_id}")
+        try:
+            await websocket.close()
+        except Exception:
+            pass
     finally:
-        active_connections.pop(session_id, None)
+        # A newer connection for the same session may have replaced this one
+        if active_connections.get(session_id) is websocket:
+            del active_connections[session_id]
+            if CANCEL_ON_DISCONNECT:
+                _spawn(_cancel_if_gone(session_id))
+
+
+def _handle_client_frame(session_id: str, raw: str):
+    """
+    Client frames: {"type": "pong"} keeps the socket alive (any frame does);
+    {"type": "cancel", "msg_id": N} stops that reply, or every running reply
+    in the session without msg_id.
+    """
+    try:
+        frame = json.loads(raw)
+    except ValueError:
+        return
+    if not isinstance(frame, dict) or frame.get("type") != "cancel":
+        return
+    try:
+        session_id = str(uuid.UUID(session_id))   # as process_message records it
+    except ValueError:
+        return
+    if isinstance(frame.get("msg_id"), int):
+        _spawn(cancel_message(frame["msg_id"], session_id))
+    else:
+        cancel_session(session_id)
+
+
+async def _ping(websocket: WebSocket):
+    while True:
+        await asyncio.sleep(WS_PING_INTERVAL)
+        try:
+            await websocket.send_text('{"type": "ping"}')
+        except Exception:
+            return
 
 
 @app.post("/session/{session_id}/change-model")
-def change_model(session_id: uuid.UUID, model: str):
-    update_session_model(session_id, model)
+async def change_model(session_id: uuid.UUID, model: str):
+    await update_session_model(session_id, model)
+    return {"status": "ok"}
+
+
+@app.post("/session/{session_id}/cache")
+async def set_session_cache(session_id: uuid.UUID, enabled: bool):
+    """Opt a session in or out of the completion cache."""
+    await update_session_cache(session_id, enabled)
+    return {"status": "ok"}
+
+
+class FallbackPayload(BaseModel):
+    models: list[str]
+
+
+@app.post("/session/{session_id}/fallbacks")
+async def set_session_fallbacks(session_id: uuid.UUID, payload: FallbackPayload):
+    """Models to try, in order, when the session's model fails or is slow."""
+    await update_session_fallbacks(session_id, payload.models)
     return {"status": "ok"}
\ No newline at end of file